@@ -1,37 +1,209 @@
-import re
-from datetime import datetime
-
-def analyze_benchmark_log(log_file):
-    with open(log_file, 'r') as file:
-        lines = file.readlines()
-    
-    timestamps = []
-    response_times = []
+import argparse
+import json
+from datetime import date, datetime
+
+# Log lines start with a fixed-layout timestamp: "2024-11-30 20:12:02,889"
+TIMESTAMP_LENGTH = 23
+
+
+class EndpointStats:
+    """
+    Running counters for one endpoint, kept in constant memory.
+    """
+    def __init__(self):
+        self.success = 0
+        self.error = 0
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def record(self, success, latency_ms, weight=1):
+        # A record kept with sample rate r stands for 1 / r requests
+        if success:
+            self.success += weight
+        else:
+            self.error += weight
+        if latency_ms is not None:
+            self.latency_count += weight
+            self.latency_sum += latency_ms * weight
+            if latency_ms > self.latency_max:
+                self.latency_max = latency_ms
+
+
+class TimestampParser:
+    """
+    Convert log timestamps to seconds without datetime.strptime.
+    The date part only changes once a day, so its ordinal is cached.
+    """
+    def __init__(self):
+        self.day = None
+        self.day_seconds = 0
+
+    def parse(self, line):
+        """
+        Args:
+            line: Log line starting with a "YYYY-MM-DD HH:MM:SS,mmm" timestamp.
+        Returns:
+            Seconds since 0001-01-01, or None if the line has no timestamp.
+        """
+        if len(line) < TIMESTAMP_LENGTH or line[4] != '-' or line[13] != ':' or line[19] != ',':
+            return None
+        try:
+            day = line[:10]
+            if day != self.day:
+                self.day_seconds = date(int(day[:4]), int(day[5:7]), int(day[8:10])).toordinal() * 86400
+                self.day = day
+            return (self.day_seconds + int(line[11:13]) * 3600 + int(line[14:16]) * 60
+                    + int(line[17:19]) + int(line[20:23]) / 1000)
+        except ValueError:
+            return None
+
+
+def parse_event(line):
+    """
+    Extract the endpoint, outcome and latency of a benchmark log line such as
+    "... - INFO - ping-read success - item_id=23, status_code=200, latency_ms=6.633".
+    Args:
+        line: Log line.
+    Returns:
+        Tuple (endpoint, success, latency_ms), or None if the line is not a request record.
+    """
+    parts = line[TIMESTAMP_LENGTH + 3:].split(' - ', 2)
+    if len(parts) < 2:
+        return None
+    endpoint, _, outcome = parts[1].rpartition(' ')
+    if outcome not in ('success', 'error') or not endpoint:
+        return None
+
+    latency_ms = None
+    if len(parts) == 3:
+        position = parts[2].rfind('latency_ms=')
+        if position != -1:
+            try:
+                latency_ms = float(parts[2][position + 11:].split(',', 1)[0])
+            except ValueError:
+                pass
+    return endpoint, outcome == 'success', latency_ms
+
+
+def parse_json_event(line):
+    """
+    Extract the time, endpoint, outcome, latency and weight of a JSON request record such as
+    {"time": "2024-11-30 20:12:02,889", "endpoint": "ping-read", "outcome": "success", "latency_ms": 6.633, ...}.
+    Args:
+        line: Log line holding a JSON object.
+    Returns:
+        Tuple (time, endpoint, success, latency_ms, weight), or None if the line is not a request record.
+    """
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if record.get('outcome') not in ('success', 'error') or 'endpoint' not in record:
+        return None
+    return (record.get('time', ''), record['endpoint'], record['outcome'] == 'success', record.get('latency_ms'),
+            round(1 / record.get('sample_rate', 1)))
+
+
+def print_bucket(start, width, success, error):
+    # Buckets are printed as soon as they are complete so nothing is kept for them
+    label = datetime.fromordinal(int(start // 86400)).replace(
+        hour=int(start % 86400 // 3600), minute=int(start % 3600 // 60), second=int(start % 60))
+    total = success + error
+    print(f"{label:%Y-%m-%d %H:%M:%S}  {total:>8}  {total / width:>10.2f}  {error:>7}")
+
+
+def analyze_benchmark_log(log_file, bucket_seconds=10):
+    """
+    Analyze a benchmark log in a single streaming pass using constant memory.
+    Prints throughput per time bucket as it goes, then totals, throughput and
+    latency per endpoint split by success and error.
+    Both the JSON lines of load_generator and the older text lines are read; sampled
+    JSON records are counted for the requests they stand for.
+    Args:
+        log_file: Path of the benchmark log.
+        bucket_seconds: Width of the throughput buckets in seconds, 0 to disable them.
+    Returns:
+        Dict mapping endpoint to EndpointStats.
+    """
+    timestamps = TimestampParser()
+    endpoints = {}
     start_time = None
     end_time = None
+    bucket_start = None
+    bucket_success = bucket_error = 0
+
+    if bucket_seconds:
+        print(f"{'Bucket start':<19}  {'Requests':>8}  {'Req/second':>10}  {'Errors':>7}")
+
+    with open(log_file, 'r', buffering=1 << 20, errors='replace') as file:
+        for line in file:
+            if line.startswith('{'):
+                event = parse_json_event(line)
+                if event is None:
+                    continue
+                time_text, endpoint, success, latency_ms, weight = event
+                timestamp = timestamps.parse(time_text)
+            else:
+                timestamp = timestamps.parse(line)
+                event = parse_event(line.rstrip('\n')) if timestamp is not None else None
+                if event is None:
+                    continue
+                endpoint, success, latency_ms = event
+                weight = 1
+            if timestamp is None:
+                continue
 
-    for line in lines:
-        match = re.search(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3})', line)
-        if match:
-            timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S,%f")
-            timestamps.append(timestamp)
-            if not start_time:
+            if start_time is None:
                 start_time = timestamp
-            end_time = timestamp
-    
-    for i in range(1, len(timestamps)):
-        response_time = (timestamps[i] - timestamps[i-1]).total_seconds() * 1000  # ms
-        response_times.append(response_time)
-    
-    total_requests = len(response_times)
-    total_time = (end_time - start_time).total_seconds()
+                bucket_start = timestamp - timestamp % bucket_seconds if bucket_seconds else timestamp
+            end_time = max(end_time or timestamp, timestamp)
+
+            stats = endpoints.get(endpoint)
+            if stats is None:
+                stats = endpoints[endpoint] = EndpointStats()
+            stats.record(success, latency_ms, weight)
+
+            if bucket_seconds:
+                # Slightly out-of-order lines are counted in the current bucket
+                while timestamp >= bucket_start + bucket_seconds:
+                    print_bucket(bucket_start, bucket_seconds, bucket_success, bucket_error)
+                    bucket_start += bucket_seconds
+                    bucket_success = bucket_error = 0
+                if success:
+                    bucket_success += weight
+                else:
+                    bucket_error += weight
+
+    if bucket_seconds and start_time is not None:
+        print_bucket(bucket_start, bucket_seconds, bucket_success, bucket_error)
+
+    total_requests = sum(stats.success + stats.error for stats in endpoints.values())
+    total_time = end_time - start_time if start_time is not None else 0
     throughput = total_requests / total_time if total_time > 0 else 0
-    avg_response_time = sum(response_times) / len(response_times) if response_times else 0
 
+    print()
     print(f"Total Requests: {total_requests}")
     print(f"Total Time: {total_time:.2f} seconds")
     print(f"Throughput: {throughput:.2f} requests/second")
-    print(f"Average Response Time: {avg_response_time:.2f} ms")
+    print()
+    print(f"{'Endpoint':<16}  {'Success':>8}  {'Error':>7}  {'Req/second':>10}  {'Avg latency':>11}  {'Max latency':>11}")
+    for endpoint in sorted(endpoints):
+        stats = endpoints[endpoint]
+        rate = (stats.success + stats.error) / total_time if total_time > 0 else 0
+        if stats.latency_count:
+            average = f"{stats.latency_sum / stats.latency_count:.2f} ms"
+            maximum = f"{stats.latency_max:.2f} ms"
+        else:
+            average = maximum = "n/a"
+        print(f"{endpoint:<16}  {stats.success:>8}  {stats.error:>7}  {rate:>10.2f}  {average:>11}  {maximum:>11}")
+
+    return endpoints
+
 
-log_file = "benchmark_log.txt"
-analyze_benchmark_log(log_file)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze a benchmark log.")
+    parser.add_argument('log_file', nargs='?', default="benchmark_log.txt")
+    parser.add_argument('--bucket', type=float, default=10, help="Throughput bucket width in seconds, 0 to disable")
+    args = parser.parse_args()
+    analyze_benchmark_log(args.log_file, args.bucket)
@@ -0,0 +1,132 @@
+import argparse
+import os
+import random
+import time
+
+import mysql.connector
+
+# The hot statements of the worker and manager services
+SELECT_QUERY = "SELECT first_name, last_name FROM actor WHERE actor_id = %s"
+INSERT_QUERY = "INSERT INTO actor (first_name, last_name) VALUES (%s, %s)"
+
+# Session counters showing how often MySQL parsed a query or a statement
+STATUS_COUNTERS = ('Com_select', 'Com_insert', 'Com_stmt_prepare', 'Com_stmt_execute')
+
+
+def find_mysqld():
+    """
+    Returns:
+        PID of the local mysqld process, or None if MySQL runs on another host.
+    """
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/comm') as file:
+                if file.read().strip() == 'mysqld':
+                    return int(pid)
+        except OSError:
+            continue
+    return None
+
+
+def process_cpu_seconds(pid):
+    # User and system time of a process, from /proc/<pid>/stat
+    with open(f'/proc/{pid}/stat') as file:
+        fields = file.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def session_status(conn):
+    cursor = conn.cursor()
+    cursor.execute("SHOW SESSION STATUS WHERE Variable_name IN (%s, %s, %s, %s)", STATUS_COUNTERS)
+    status = {name: int(value) for name, value in cursor.fetchall()}
+    cursor.close()
+    return status
+
+
+def run_queries(conn, mode, statement, iterations, num_rows):
+    """
+    Run one statement repeatedly, as the services did before (text protocol, a new cursor
+    per call) or as they do now (one server-side prepared statement reused).
+    Args:
+        conn: MySQL connection.
+        mode: 'text' or 'prepared'.
+        statement: 'select' or 'insert'. Inserts are rolled back, so the table does not grow.
+        iterations: Number of queries.
+        num_rows: Rows the SELECT picks its actor_id from.
+    """
+    query = SELECT_QUERY if statement == 'select' else INSERT_QUERY
+    prepared = conn.cursor(prepared=True) if mode == 'prepared' else None
+    for _ in range(iterations):
+        if statement == 'select':
+            params = (random.randint(1, num_rows),)
+        else:
+            params = (f"Name{random.randint(1, 100)}", f"Surname{random.randint(1, 100)}")
+        cursor = prepared or conn.cursor()
+        cursor.execute(query, params)
+        if statement == 'select':
+            cursor.fetchall()
+        else:
+            conn.rollback()
+        if prepared is None:
+            cursor.close()
+    if prepared is not None:
+        prepared.close()
+
+
+def benchmark_queries(connect_args, iterations=5000, num_rows=200, mysqld_pid=None):
+    """
+    Compare the hot SELECT and INSERT of the services in the text protocol and as
+    prepared statements: wall time, client CPU and, when MySQL runs on this host,
+    mysqld CPU per query. Run it on a worker or manager, where t2.micro CPU is scarce.
+    Args:
+        connect_args: Keyword arguments of mysql.connector.connect.
+        iterations: Queries per statement and mode.
+        num_rows: Rows the SELECT picks its actor_id from.
+        mysqld_pid: PID of mysqld, looked up in /proc by default.
+    Returns:
+        Dict mapping (statement, mode) to the measured microseconds per query.
+    """
+    mysqld_pid = mysqld_pid or find_mysqld()
+    conn = mysql.connector.connect(use_pure=False, **connect_args)
+    print(f"Connection class: {type(conn).__name__}, mysqld CPU: "
+          f"{'measured (PID ' + str(mysqld_pid) + ')' if mysqld_pid else 'not measured, MySQL is not local'}")
+    print(f"{'Statement':<10} {'Mode':<9} {'Wall us':>9} {'Client CPU us':>14} {'mysqld CPU us':>14}  Server counters")
+
+    results = {}
+    for statement in ('select', 'insert'):
+        for mode in ('text', 'prepared'):
+            # Warm up the buffer pool and the cursor classes before measuring
+            run_queries(conn, mode, statement, min(iterations, 200), num_rows)
+            status = session_status(conn)
+            server_cpu = process_cpu_seconds(mysqld_pid) if mysqld_pid else None
+            client_cpu = time.process_time()
+            started = time.perf_counter()
+            run_queries(conn, mode, statement, iterations, num_rows)
+            wall = (time.perf_counter() - started) / iterations * 1e6
+            client = (time.process_time() - client_cpu) / iterations * 1e6
+            server = (process_cpu_seconds(mysqld_pid) - server_cpu) / iterations * 1e6 if mysqld_pid else None
+            counters = session_status(conn)
+            counters = {name: counters[name] - status[name] for name in STATUS_COUNTERS if counters[name] != status[name]}
+            results[(statement, mode)] = {'wall_us': wall, 'client_cpu_us': client, 'mysqld_cpu_us': server}
+            server_text = f"{server:>14.1f}" if server is not None else f"{'n/a':>14}"
+            print(f"{statement:<10} {mode:<9} {wall:>9.1f} {client:>14.1f} {server_text}  "
+                  + ", ".join(f"{name}={value}" for name, value in counters.items()))
+
+    conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare text and prepared statements for the hot queries.")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='api_user')
+    parser.add_argument('--password', default='api_password')
+    parser.add_argument('--database', default='sakila')
+    parser.add_argument('--iterations', type=int, default=5000, help="Queries per statement and mode")
+    parser.add_argument('--num-rows', type=int, default=200, help="Rows the SELECT picks its actor_id from")
+    parser.add_argument('--mysqld-pid', type=int, default=None, help="Defaults to the local mysqld process")
+    args = parser.parse_args()
+    benchmark_queries({'host': args.host, 'user': args.user, 'password': args.password, 'database': args.database},
+                      args.iterations, args.num_rows, args.mysqld_pid)
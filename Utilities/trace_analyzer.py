@@ -0,0 +1,121 @@
+import argparse
+import json
+from collections import defaultdict
+
+
+def load_spans(trace_files):
+    """
+    Args:
+        trace_files: Span files of the nodes (traces.jsonl), in any order.
+    Returns:
+        Dict of trace ID to the list of its spans.
+    """
+    traces = defaultdict(list)
+    for trace_file in trace_files:
+        with open(trace_file) as file:
+            for line in file:
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    # The last line of a node that was stopped while writing
+                    continue
+                traces[span["trace_id"]].append(span)
+    return traces
+
+
+def self_times(spans):
+    """
+    Time of each span not covered by its children, which is where the time actually went:
+    a client span minus the server span of the next hop is network and queueing.
+    Args:
+        spans: Spans of one trace.
+    Returns:
+        Dict of span ID to milliseconds.
+    """
+    times = {span["span_id"]: span["duration_ms"] for span in spans}
+    for span in spans:
+        if span["parent_id"] in times:
+            times[span["parent_id"]] -= span["duration_ms"]
+    return {span_id: max(milliseconds, 0.0) for span_id, milliseconds in times.items()}
+
+
+def span_label(span):
+    if span["kind"] == "client":
+        return f"{span['service']} -> {span['name']}"
+    return f"{span['service']} {span['name']}"
+
+
+def print_trace(spans):
+    children = defaultdict(list)
+    for span in spans:
+        children[span["parent_id"]].append(span)
+    ids = {span["span_id"] for span in spans}
+    # Spans whose parent is missing (not exported yet, or on a node whose file is not given) are shown as roots
+    stack = [(span, 0) for span in sorted((span for span in spans if span["parent_id"] not in ids),
+                                          key=lambda span: span["start"], reverse=True)]
+    while stack:
+        span, depth = stack.pop()
+        status = "" if span["status"] == "ok" else f"  [{span['status']}]"
+        print(f"    {'  ' * depth}{span_label(span):<{60 - 2 * depth}} {span['duration_ms']:>9.2f} ms{status}")
+        for child in sorted(children[span["span_id"]], key=lambda child: child["start"], reverse=True):
+            stack.append((child, depth + 1))
+
+
+def analyze_traces(trace_files, slowest=5, percentile=99):
+    """
+    Print where the time of the traced requests goes, overall and for the slowest ones.
+    Args:
+        trace_files: Span files of the nodes.
+        slowest: Number of slowest traces printed span by span.
+        percentile: Requests at or above this latency percentile form the tail.
+    Returns:
+        Dict of trace ID to the list of its spans.
+    """
+    traces = load_spans(trace_files)
+    roots = []
+    for trace_id, spans in traces.items():
+        root = min(spans, key=lambda span: span["start"])
+        if root["parent_id"] is None:
+            roots.append((root["duration_ms"], trace_id))
+    if not roots:
+        print("No complete trace found.")
+        return traces
+    roots.sort()
+    cutoff = roots[min(int(len(roots) * percentile / 100), len(roots) - 1)][0]
+
+    # Self time by span label, over all traces and over the tail
+    overall = defaultdict(float)
+    tail = defaultdict(float)
+    tail_count = 0
+    for duration, trace_id in roots:
+        in_tail = duration >= cutoff
+        tail_count += in_tail
+        times = self_times(traces[trace_id])
+        for span in traces[trace_id]:
+            overall[span_label(span)] += times[span["span_id"]]
+            if in_tail:
+                tail[span_label(span)] += times[span["span_id"]]
+
+    print(f"Traces: {len(roots)}  median: {roots[len(roots) // 2][0]:.2f} ms  "
+          f"p{percentile}: {cutoff:.2f} ms  max: {roots[-1][0]:.2f} ms")
+    print()
+    print(f"Average self time per request, all traces and the {tail_count} at or above p{percentile}:")
+    print(f"    {'Span':<60} {'All':>12} {'Tail':>12}")
+    for label in sorted(overall, key=lambda label: tail[label], reverse=True):
+        print(f"    {label:<60} {overall[label] / len(roots):>9.2f} ms {tail[label] / tail_count:>9.2f} ms")
+
+    for duration, trace_id in reversed(roots[-slowest:]):
+        print()
+        print(f"Trace {trace_id}: {duration:.2f} ms")
+        print_trace(traces[trace_id])
+
+    return traces
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze the request traces of the cluster nodes.")
+    parser.add_argument('trace_files', nargs='+', help="traces.jsonl files copied from the nodes")
+    parser.add_argument('--slowest', type=int, default=5, help="Number of slowest traces to print in full")
+    parser.add_argument('--percentile', type=float, default=99, help="Latency percentile where the tail starts")
+    args = parser.parse_args()
+    analyze_traces(args.trace_files, args.slowest, args.percentile)
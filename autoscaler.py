@@ -0,0 +1,390 @@
+import argparse
+import math
+import random
+import time
+
+import requests
+
+# Bounds of the worker pool
+MIN_WORKERS = 1
+MAX_WORKERS = 8
+
+# Scale up when the slowest active worker's p99 read latency, the outstanding reads per
+# worker or the read rate per worker is above its threshold. Scale down only when every
+# signal is under a lower threshold, and the rate would still be under it with one worker
+# less, so that a scale-down does not immediately trigger a scale-up (hysteresis).
+SCALE_UP_P99_MS = 50
+SCALE_DOWN_P99_MS = 30
+SCALE_UP_OUTSTANDING = 8  # Outstanding reads per active worker
+SCALE_DOWN_OUTSTANDING = 2
+MAX_RATE_PER_WORKER = 200  # Reads/second
+SCALE_DOWN_RATE_FRACTION = 0.6  # Of MAX_RATE_PER_WORKER, with one worker less
+
+# A signal must hold for SUSTAIN consecutive evaluations, and a scaling action is only
+# taken COOLDOWN seconds after the previous one
+EVALUATION_INTERVAL = 15  # Seconds
+SUSTAIN = 3
+SCALE_UP_COOLDOWN = 120  # Seconds
+SCALE_DOWN_COOLDOWN = 300  # Seconds
+
+
+class Autoscaler:
+    """
+    Feedback loop adding and removing read replicas according to the Proxy's /worker-stats.
+    The backend provides now(), sleep(seconds), read_stats(), add_worker() and
+    remove_worker(worker_ip); see ProxyClusterBackend and SimulatedCluster.
+    """
+    def __init__(self, backend, min_workers=MIN_WORKERS, max_workers=MAX_WORKERS,
+                 scale_up_p99_ms=SCALE_UP_P99_MS, scale_down_p99_ms=SCALE_DOWN_P99_MS,
+                 scale_up_outstanding=SCALE_UP_OUTSTANDING, scale_down_outstanding=SCALE_DOWN_OUTSTANDING,
+                 max_rate_per_worker=MAX_RATE_PER_WORKER, scale_down_rate_fraction=SCALE_DOWN_RATE_FRACTION,
+                 sustain=SUSTAIN, scale_up_cooldown=SCALE_UP_COOLDOWN, scale_down_cooldown=SCALE_DOWN_COOLDOWN):
+        self.backend = backend
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.scale_up_p99_ms = scale_up_p99_ms
+        self.scale_down_p99_ms = scale_down_p99_ms
+        self.scale_up_outstanding = scale_up_outstanding
+        self.scale_down_outstanding = scale_down_outstanding
+        self.max_rate_per_worker = max_rate_per_worker
+        self.scale_down_rate_fraction = scale_down_rate_fraction
+        self.sustain = sustain
+        self.scale_up_cooldown = scale_up_cooldown
+        self.scale_down_cooldown = scale_down_cooldown
+
+        self.high_streak = 0
+        self.low_streak = 0
+        self.last_action_time = None
+        self.previous_reads = None
+        self.previous_time = None
+
+    def summarize(self, stats, now):
+        """
+        Reduce a /worker-stats report to the signals the policy uses.
+        Args:
+            stats: Report returned by the backend's read_stats().
+            now: Time of the report in seconds.
+        Returns:
+            Dict with the active and pending worker counts, the read rate over the
+            previous interval, the worst p99 and the outstanding reads per active worker.
+        """
+        workers = stats['workers']
+        active = {worker_ip: worker for worker_ip, worker in workers.items() if worker['state'] == 'active'}
+        pending = sum(1 for worker in workers.values() if worker['state'] == 'joining')
+
+        # Reads are cumulative per worker; a removed worker takes its count with it,
+        # in which case the rate of this interval is unknown
+        reads = sum(worker['reads'] for worker in workers.values())
+        rate = None
+        if self.previous_reads is not None and now > self.previous_time and reads >= self.previous_reads:
+            rate = (reads - self.previous_reads) / (now - self.previous_time)
+        self.previous_reads = reads
+        self.previous_time = now
+
+        p99s = [worker['p99_ms'] for worker in active.values() if worker['p99_ms'] is not None]
+        return {
+            'active': len(active),
+            'pending': pending,
+            'rate': rate,
+            'p99_ms': max(p99s) if p99s else None,
+            'outstanding': sum(worker['outstanding'] for worker in active.values()) / len(active) if active else 0,
+            'idle_worker': min(active, key=lambda worker_ip: active[worker_ip]['outstanding']) if active else None,
+        }
+
+    def evaluate(self, signals, now):
+        """
+        Decide on a scaling action.
+        Args:
+            signals: Dict returned by summarize().
+            now: Current time in seconds.
+        Returns:
+            Tuple (action, reason) where action is 'up', 'down' or None.
+        """
+        active = signals['active']
+        p99 = signals['p99_ms']
+        rate = signals['rate']
+
+        if active < self.min_workers:
+            self.high_streak = self.low_streak = 0
+            if active + signals['pending'] < self.min_workers:
+                return 'up', f"{active} active workers, below the minimum of {self.min_workers}"
+            return None, "waiting for joining workers"
+
+        high = []
+        if p99 is not None and p99 > self.scale_up_p99_ms:
+            high.append(f"p99 {p99:.1f}ms > {self.scale_up_p99_ms}ms")
+        if signals['outstanding'] > self.scale_up_outstanding:
+            high.append(f"{signals['outstanding']:.1f} outstanding/worker > {self.scale_up_outstanding}")
+        if rate is not None and rate / active > self.max_rate_per_worker:
+            high.append(f"{rate / active:.0f} reads/s/worker > {self.max_rate_per_worker}")
+
+        low = (
+            active > self.min_workers
+            and (p99 is None or p99 < self.scale_down_p99_ms)
+            and signals['outstanding'] < self.scale_down_outstanding
+            and rate is not None
+            and rate / (active - 1) < self.max_rate_per_worker * self.scale_down_rate_fraction
+        )
+
+        self.high_streak = self.high_streak + 1 if high else 0
+        self.low_streak = self.low_streak + 1 if low else 0
+        since_last_action = now - self.last_action_time if self.last_action_time is not None else math.inf
+
+        if high:
+            if signals['pending']:
+                return None, f"{', '.join(high)}, {signals['pending']} workers already joining"
+            if active >= self.max_workers:
+                return None, f"{', '.join(high)}, already at the maximum of {self.max_workers} workers"
+            if self.high_streak < self.sustain:
+                return None, f"{', '.join(high)} ({self.high_streak}/{self.sustain})"
+            if since_last_action < self.scale_up_cooldown:
+                return None, f"{', '.join(high)}, cooling down"
+            return 'up', ', '.join(high)
+        if low:
+            if self.low_streak < self.sustain:
+                return None, f"under-utilized ({self.low_streak}/{self.sustain})"
+            if since_last_action < self.scale_down_cooldown:
+                return None, "under-utilized, cooling down"
+            return 'down', f"{rate:.0f} reads/s fit on {active - 1} workers"
+        return None, "steady"
+
+    def step(self):
+        """
+        Read the Proxy statistics once, then add or remove a worker if the policy says so.
+        Returns:
+            Tuple (signals, action, reason).
+        """
+        now = self.backend.now()
+        signals = self.summarize(self.backend.read_stats(), now)
+        action, reason = self.evaluate(signals, now)
+        if action == 'up':
+            self.backend.add_worker()
+        elif action == 'down':
+            self.backend.remove_worker(signals['idle_worker'])
+        if action:
+            self.last_action_time = now
+            self.high_streak = self.low_streak = 0
+        return signals, action, reason
+
+    def run(self, duration=None, interval=EVALUATION_INTERVAL):
+        """
+        Evaluate every `interval` seconds, for `duration` seconds or until interrupted.
+        Args:
+            duration: Seconds to run, None to run forever.
+            interval: Seconds between two evaluations.
+        """
+        start = self.backend.now()
+        while duration is None or self.backend.now() - start < duration:
+            signals, action, reason = self.step()
+            print_step(self.backend.now() - start, signals, action, reason)
+            self.backend.sleep(interval)
+
+
+def print_step(elapsed, signals, action, reason):
+    rate = f"{signals['rate']:.0f}" if signals['rate'] is not None else "-"
+    p99 = f"{signals['p99_ms']:.1f}" if signals['p99_ms'] is not None else "-"
+    print(f"{elapsed:>8.0f}s  workers={signals['active']}+{signals['pending']}  rate={rate:>5}/s  "
+          f"p99={p99:>7}ms  outstanding={signals['outstanding']:>5.1f}  {(action or '-'):<4}  {reason}")
+
+
+class ProxyClusterBackend:
+    """
+    Backend acting on the deployed cluster. It reads the Proxy over its private IP, so
+    it must run from inside the VPC. New workers are launched with setup_worker and
+    register themselves with the Proxy; removed workers are drained, then terminated.
+    With several shards, each shard is scaled by its own autoscaler.
+    """
+    def __init__(self, ec2_client, key_pair_name, sg_id, subnet_id, manager_ip, proxy_ip,
+                 worker_instances=None, first_server_id=None, shard=0):
+        """
+        Args:
+            ec2_client: The boto3 EC2 client.
+            key_pair_name: Key pair name to SSH into new workers.
+            sg_id: Security group ID of new workers.
+            subnet_id: Subnet ID of new workers.
+            manager_ip: Private IP of the manager of the shard.
+            proxy_ip: Private IP of the Proxy.
+            worker_instances: Dict mapping the private IP of existing workers to their instance ID.
+            first_server_id: MySQL server-id of the first worker added, incremented for the next ones.
+                Defaults to one above the highest ServerId tag of the shard's instances, and at least
+                50 above the server-ids setup_mysql_cluster gives the shard.
+            shard: Index of the shard whose workers are scaled.
+        """
+        self.ec2_client = ec2_client
+        self.key_pair_name = key_pair_name
+        self.sg_id = sg_id
+        self.subnet_id = subnet_id
+        self.manager_ip = manager_ip
+        self.proxy_ip = proxy_ip
+        self.worker_instances = dict(worker_instances or {})
+        self.shard = shard
+        self.next_server_id = first_server_id or self.free_server_id()
+
+    def free_server_id(self):
+        # Tags survive a restart of the autoscaler, so the workers of a previous run keep their server-ids
+        reservations = self.ec2_client.describe_instances(Filters=[
+            {'Name': 'tag:Shard', 'Values': [str(self.shard)]},
+            {'Name': 'tag-key', 'Values': ['ServerId']},
+            {'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']},
+        ])['Reservations']
+        server_ids = [int(tag['Value']) for reservation in reservations for instance in reservation['Instances']
+                      for tag in instance.get('Tags', []) if tag['Key'] == 'ServerId']
+        return max(server_ids + [self.shard * 100 + 49]) + 1
+
+    def now(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def read_stats(self):
+        response = requests.get(f"http://{self.proxy_ip}:8000/worker-stats", timeout=10)
+        response.raise_for_status()
+        workers = response.json()['workers']
+        return {'workers': {worker_ip: worker for worker_ip, worker in workers.items() if worker['shard'] == self.shard}}
+
+    def add_worker(self):
+        # Imported here so that simulations do not need AWS credentials
+        from main_script import setup_worker
+        server_id = self.next_server_id
+        self.next_server_id += 1
+        instance_id, worker_ip = setup_worker(self.ec2_client, self.key_pair_name, self.sg_id, self.subnet_id,
+                                              self.manager_ip, f'worker{server_id}', server_id,
+                                              proxy_ip=self.proxy_ip, shard=self.shard)
+        self.worker_instances[worker_ip] = instance_id
+
+    def remove_worker(self, worker_ip):
+        from main_script import remove_worker
+        instance_id = self.worker_instances.pop(worker_ip, None)
+        if instance_id is None:
+            reservations = self.ec2_client.describe_instances(
+                Filters=[{'Name': 'private-ip-address', 'Values': [worker_ip]}]
+            )['Reservations']
+            instance_id = reservations[0]['Instances'][0]['InstanceId']
+        remove_worker(self.ec2_client, self.proxy_ip, instance_id, worker_ip)
+
+
+def diurnal_load(base_rate, peak_rate, period):
+    """
+    Build a load profile going from base_rate to peak_rate and back once per period.
+    Returns:
+        Function mapping a time in seconds to a read rate.
+    """
+    def load(t):
+        return base_rate + (peak_rate - base_rate) * (1 - math.cos(2 * math.pi * t / period)) / 2
+    return load
+
+
+class SimulatedCluster:
+    """
+    Backend simulating the Proxy and its workers, with no cloud access. Reads are spread
+    evenly over the active workers, each one an M/M/1 queue serving `capacity` reads/s,
+    and new workers take `boot_seconds` to join. Time only advances in sleep().
+    """
+    def __init__(self, load, workers=2, capacity=300, boot_seconds=180, seed=0):
+        """
+        Args:
+            load: Function mapping the simulated time in seconds to the offered read rate.
+            workers: Number of workers at the start.
+            capacity: Reads/second a worker serves at full utilization.
+            boot_seconds: Seconds between add_worker() and the worker joining the rotation.
+            seed: Seed of the latency noise.
+        """
+        self.load = load
+        self.capacity = capacity
+        self.boot_seconds = boot_seconds
+        self.random = random.Random(seed)
+        self.clock = 0.0
+        self.workers = {}
+        self.next_host = 1
+        for _ in range(workers):
+            self._create_worker('active')
+
+    def _create_worker(self, state):
+        worker_ip = f"10.0.1.{self.next_host}"
+        self.next_host += 1
+        self.workers[worker_ip] = {'state': state, 'ready_at': self.clock + self.boot_seconds, 'reads': 0.0}
+        return worker_ip
+
+    def _active(self):
+        return [worker_ip for worker_ip, worker in self.workers.items() if worker['state'] == 'active']
+
+    def now(self):
+        return self.clock
+
+    def sleep(self, seconds):
+        elapsed = 0.0
+        while elapsed < seconds:
+            step = min(1.0, seconds - elapsed)
+            for worker in self.workers.values():
+                if worker['state'] == 'joining' and worker['ready_at'] <= self.clock:
+                    worker['state'] = 'active'
+            active = self._active()
+            if active:
+                # Work beyond the capacity of the pool is not served
+                served = min(self.load(self.clock), self.capacity * len(active))
+                for worker_ip in active:
+                    self.workers[worker_ip]['reads'] += served / len(active) * step
+            self.clock += step
+            elapsed += step
+
+    def read_stats(self):
+        active = self._active()
+        rate = self.load(self.clock) / len(active) if active else 0
+        # Mean latency of an M/M/1 queue is 1 / (capacity - rate) and its p99 about 4.6
+        # times that; utilization is capped so an overloaded worker reports a large but finite value
+        utilization = min(rate / self.capacity, 0.99)
+        mean_ms = 1000 / (self.capacity * (1 - utilization))
+        stats = {}
+        for worker_ip, worker in self.workers.items():
+            serving = worker['state'] == 'active'
+            noise = self.random.uniform(0.9, 1.1)
+            stats[worker_ip] = {
+                'state': worker['state'],
+                'in_rotation': serving,
+                'outstanding': round(utilization / (1 - utilization) * noise) if serving else 0,
+                'reads': int(worker['reads']),
+                'errors': 0,
+                'p50_ms': round(mean_ms * math.log(2) * noise, 3) if serving else None,
+                'p99_ms': round(mean_ms * math.log(100) * noise, 3) if serving else None,
+            }
+        return {'workers': stats}
+
+    def add_worker(self):
+        self._create_worker('joining')
+
+    def remove_worker(self, worker_ip):
+        del self.workers[worker_ip]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scale the read replicas of the cluster from the Proxy statistics.")
+    parser.add_argument('--simulate', action='store_true', help="Run against a simulated cluster")
+    parser.add_argument('--proxy-ip', help="Private IP of the Proxy")
+    parser.add_argument('--manager-ip', help="Private IP of the manager of the shard")
+    parser.add_argument('--shard', type=int, default=0, help="Index of the shard to scale")
+    parser.add_argument('--key-pair', help="Key pair name of new workers")
+    parser.add_argument('--sg-id', help="Security group ID of new workers")
+    parser.add_argument('--subnet-id', help="Subnet ID of new workers")
+    parser.add_argument('--interval', type=float, default=EVALUATION_INTERVAL)
+    parser.add_argument('--duration', type=float, default=None, help="Seconds to run, forever by default")
+    parser.add_argument('--min-workers', type=int, default=MIN_WORKERS)
+    parser.add_argument('--max-workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--base-rate', type=float, default=100, help="Simulated reads/second at the quietest time")
+    parser.add_argument('--peak-rate', type=float, default=1500, help="Simulated reads/second at the peak")
+    parser.add_argument('--period', type=float, default=7200, help="Simulated seconds between two peaks")
+    parser.add_argument('--capacity', type=float, default=300, help="Simulated reads/second per worker")
+    args = parser.parse_args()
+
+    if args.simulate:
+        backend = SimulatedCluster(diurnal_load(args.base_rate, args.peak_rate, args.period), capacity=args.capacity)
+        duration = args.duration or args.period
+    else:
+        if not all([args.proxy_ip, args.manager_ip, args.key_pair, args.sg_id, args.subnet_id]):
+            parser.error("--proxy-ip, --manager-ip, --key-pair, --sg-id and --subnet-id are required without --simulate")
+        import boto3
+        backend = ProxyClusterBackend(boto3.client('ec2', region_name='us-east-1'), args.key_pair, args.sg_id,
+                                      args.subnet_id, args.manager_ip, args.proxy_ip, shard=args.shard)
+        duration = args.duration
+
+    Autoscaler(backend, args.min_workers, args.max_workers).run(duration, args.interval)
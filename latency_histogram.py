@@ -0,0 +1,139 @@
+import math
+
+# Each power-of-two range of values is split in 2**SUB_BUCKET_BITS linear
+# sub-buckets, which bounds the relative error of a recorded value to ~0.1%
+SUB_BUCKET_BITS = 10
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+
+def _bucket_index(value):
+    # Values below 2 * SUB_BUCKET_COUNT are stored exactly
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    if shift <= 0:
+        return value
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+
+def _bucket_bounds(index):
+    # Inverse of _bucket_index: lowest and highest value mapping to `index`
+    if index < 2 * SUB_BUCKET_COUNT:
+        return index, index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    low = (index - (shift << SUB_BUCKET_BITS)) << shift
+    return low, low + (1 << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram of latencies recorded in microseconds.
+    Memory is bounded by the number of distinct buckets (a few thousand for
+    latencies between 1us and 1h), not by the number of recorded values, and
+    histograms from several runs or processes can be merged exactly.
+    """
+    def __init__(self):
+        self.counts = {}
+        self.total_count = 0
+        self.total_sum = 0
+        self.min_value = None
+        self.max_value = 0
+
+    def record(self, seconds):
+        """
+        Record a latency.
+        Args:
+            seconds: Latency in seconds, as measured with time.perf_counter().
+        """
+        value = max(int(seconds * 1_000_000), 0)
+        index = _bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total_count += 1
+        self.total_sum += value
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if value > self.max_value:
+            self.max_value = value
+
+    def merge(self, other):
+        """
+        Add the values recorded in another histogram to this one.
+        Args:
+            other: LatencyHistogram to merge.
+        """
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += other.total_count
+        self.total_sum += other.total_sum
+        if other.min_value is not None and (self.min_value is None or other.min_value < self.min_value):
+            self.min_value = other.min_value
+        self.max_value = max(self.max_value, other.max_value)
+
+    def percentile(self, percent):
+        """
+        Get the value at a given percentile.
+        Args:
+            percent: Percentile between 0 and 100.
+        Returns:
+            Latency in microseconds, 0 if nothing was recorded.
+        """
+        if not self.total_count:
+            return 0
+        rank = max(math.ceil(self.total_count * percent / 100), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucket_bounds(index)[1], self.max_value)
+        return self.max_value
+
+    def summary(self):
+        """
+        Summarize the histogram in milliseconds.
+        Returns:
+            Dict with count, mean, p50, p90, p99, p99.9, min and max.
+        """
+        def ms(value):
+            return round(value / 1000, 3)
+
+        return {
+            'count': self.total_count,
+            'mean_ms': ms(self.total_sum / self.total_count) if self.total_count else 0,
+            'min_ms': ms(self.min_value or 0),
+            'p50_ms': ms(self.percentile(50)),
+            'p90_ms': ms(self.percentile(90)),
+            'p99_ms': ms(self.percentile(99)),
+            'p99_9_ms': ms(self.percentile(99.9)),
+            'max_ms': ms(self.max_value),
+        }
+
+    def to_dict(self):
+        """
+        Serialize the histogram, bucket counts included, so it can be stored as JSON.
+        Returns:
+            JSON serializable dict.
+        """
+        return {
+            'sub_bucket_bits': SUB_BUCKET_BITS,
+            'total_sum_us': self.total_sum,
+            'min_us': self.min_value,
+            'max_us': self.max_value,
+            'buckets': {str(index): count for index, count in sorted(self.counts.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a histogram serialized with to_dict.
+        Args:
+            data: Dict returned by to_dict.
+        Returns:
+            LatencyHistogram instance.
+        """
+        if data['sub_bucket_bits'] != SUB_BUCKET_BITS:
+            raise ValueError(f"Incompatible histogram resolution: {data['sub_bucket_bits']} sub-bucket bits")
+        histogram = cls()
+        histogram.counts = {int(index): count for index, count in data['buckets'].items()}
+        histogram.total_count = sum(histogram.counts.values())
+        histogram.total_sum = data['total_sum_us']
+        histogram.min_value = data['min_us']
+        histogram.max_value = data['max_us']
+        return histogram
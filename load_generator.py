@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+import aiohttp
+
+from latency_histogram import LatencyHistogram
+from services.logs import start_queue_logging
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of each endpoint in the generated request mix
+DEFAULT_MIX = {
+    'ping-read': 1,
+    'random-read': 1,
+    'direct-read': 1,
+    'write': 1,
+}
+
+# Read strategies exposed by the Gatekeeper and their path
+READ_PATHS = {
+    'ping-read': '/ping-read/',
+    'random-read': '/random-read/',
+    'direct-read': '/direct-read/',
+    'lor-read': '/lor-read/',
+    'p2c-read': '/p2c-read/',
+    'wrr-read': '/wrr-read/',
+}
+
+# Write endpoints exposed by the Gatekeeper and their path
+WRITE_PATHS = {
+    'write': '/write',
+    'write-batch': '/write_batch',
+}
+
+# Reads of several item_ids in one request, batch_size of them
+MULTI_READ_PATHS = {
+    'read-many': '/read_many',
+}
+
+
+class LoadStats:
+    """
+    Per-endpoint counters and latency histograms collected while a load test runs.
+    """
+    def __init__(self):
+        self.successes = {}
+        self.errors = {}
+        self.latencies = {}
+        self.start_time = None
+        self.end_time = None
+
+    def record(self, endpoint, success, latency):
+        counters = self.successes if success else self.errors
+        counters[endpoint] = counters.get(endpoint, 0) + 1
+        if success:
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = LatencyHistogram()
+            self.latencies[endpoint].record(latency)
+
+    def summary(self):
+        """
+        Build a summary of the run.
+        Returns:
+            Dict with total counts, elapsed time, throughput, and per-endpoint counts
+            and latency percentiles of successful requests.
+        """
+        elapsed = (self.end_time or time.monotonic()) - self.start_time
+        endpoints = sorted(set(self.successes) | set(self.errors))
+        total = sum(self.successes.values()) + sum(self.errors.values())
+        overall = LatencyHistogram()
+        for histogram in self.latencies.values():
+            overall.merge(histogram)
+        return {
+            'total_requests': total,
+            'total_errors': sum(self.errors.values()),
+            'elapsed_seconds': elapsed,
+            'throughput': total / elapsed if elapsed > 0 else 0,
+            'latency': overall.summary(),
+            'endpoints': {
+                endpoint: {
+                    'success': self.successes.get(endpoint, 0),
+                    'error': self.errors.get(endpoint, 0),
+                    'latency': self.latencies.get(endpoint, LatencyHistogram()).summary(),
+                }
+                for endpoint in endpoints
+            },
+        }
+
+    def histograms(self):
+        """
+        Serialize the latency histogram of each endpoint.
+        Returns:
+            Dict mapping endpoint to LatencyHistogram.to_dict().
+        """
+        return {endpoint: histogram.to_dict() for endpoint, histogram in self.latencies.items()}
+
+
+def parse_mix(mix_spec):
+    """
+    Parse a mix specification such as "random-read=3,write=1".
+    Args:
+        mix_spec: Comma separated list of endpoint=weight pairs.
+    Returns:
+        Dict mapping endpoint to weight.
+    """
+    mix = {}
+    for part in mix_spec.split(','):
+        endpoint, _, weight = part.partition('=')
+        endpoint = endpoint.strip()
+        if endpoint not in READ_PATHS and endpoint not in WRITE_PATHS and endpoint not in MULTI_READ_PATHS:
+            raise ValueError(f"Unknown endpoint in mix: {endpoint}")
+        mix[endpoint] = float(weight) if weight else 1.0
+    return mix
+
+
+async def send_request(session, base_url, endpoint, num_rows, stats, scheduled=None, batch_size=10):
+    """
+    Send a single request to the cluster and record its outcome and latency.
+    Args:
+        session: The aiohttp client session.
+        base_url: Base URL of the Gatekeeper, e.g. http://1.2.3.4:8000.
+        endpoint: Name of the endpoint (one of WRITE_PATHS or READ_PATHS).
+        num_rows: Number of rows that can be read back.
+        stats: LoadStats instance to update.
+        scheduled: time.perf_counter() value at which the request was due to start.
+            Open-loop tests pass it so that time spent queued behind the concurrency
+            limit counts in the latency. Defaults to the moment the request is sent.
+        batch_size: Number of items sent by a 'write-batch' request or read by a 'read-many' request.
+    """
+    started = scheduled if scheduled is not None else time.perf_counter()
+    try:
+        if endpoint == 'write':
+            column1 = f"Name{random.randint(1, 100)}"
+            column2 = f"Surname{random.randint(1, 100)}"
+            details = {'column1': column1, 'column2': column2}
+            request = session.post(f"{base_url}{WRITE_PATHS[endpoint]}", json={'column1': column1, 'column2': column2})
+        elif endpoint == 'write-batch':
+            items = [
+                {'column1': f"Name{random.randint(1, 100)}", 'column2': f"Surname{random.randint(1, 100)}"}
+                for _ in range(batch_size)
+            ]
+            details = {'items': batch_size}
+            request = session.post(f"{base_url}{WRITE_PATHS[endpoint]}", json={'items': items})
+        elif endpoint == 'read-many':
+            item_ids = random.sample(range(1, num_rows + 1), min(batch_size, num_rows))
+            details = {'item_ids': len(item_ids)}
+            request = session.post(f"{base_url}{MULTI_READ_PATHS[endpoint]}", json={'item_ids': item_ids})
+        else:
+            item_id = random.randint(1, num_rows)
+            details = {'item_id': item_id}
+            request = session.get(f"{base_url}{READ_PATHS[endpoint]}", params={'item_id': item_id})
+
+        async with request as response:
+            await response.read()
+            response.raise_for_status()
+        latency = time.perf_counter() - started
+        stats.record(endpoint, True, latency)
+        logger.info("%s success", endpoint, extra={
+            'endpoint': endpoint, 'outcome': 'success', **details,
+            'status_code': response.status, 'latency_ms': round(latency * 1000, 3),
+        })
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        latency = time.perf_counter() - started
+        stats.record(endpoint, False, latency)
+        logger.error("%s error", endpoint, extra={
+            'endpoint': endpoint, 'outcome': 'error', **details,
+            'error': str(e), 'latency_ms': round(latency * 1000, 3),
+        })
+
+
+async def _closed_loop(session, base_url, endpoints, weights, num_rows, stats, deadline, batch_size):
+    # Each worker keeps exactly one request in flight until the deadline
+    while time.monotonic() < deadline:
+        endpoint = random.choices(endpoints, weights)[0]
+        await send_request(session, base_url, endpoint, num_rows, stats, batch_size=batch_size)
+
+
+async def _open_loop(session, base_url, endpoints, weights, num_rows, stats, rate, duration, concurrency, batch_size):
+    # Requests are issued on a fixed schedule whatever the response times are,
+    # queueing client-side once `concurrency` requests are already in flight
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = set()
+
+    async def bounded_request(endpoint, scheduled):
+        async with semaphore:
+            await send_request(session, base_url, endpoint, num_rows, stats, scheduled, batch_size)
+
+    start = time.perf_counter()
+    sent = 0
+    while sent / rate < duration:
+        scheduled = start + sent / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        endpoint = random.choices(endpoints, weights)[0]
+        task = asyncio.create_task(bounded_request(endpoint, scheduled))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        sent += 1
+
+    if pending:
+        await asyncio.gather(*pending)
+
+
+async def run_load_test(base_url, concurrency=32, rate=None, duration=60, mix=None, num_rows=50, timeout=30,
+                        batch_size=10):
+    """
+    Generate load against the cluster.
+    Without a rate the test is closed-loop: `concurrency` clients send requests back to back.
+    With a rate the test is open-loop: requests are started at `rate` per second and at
+    most `concurrency` of them are in flight at once.
+    Args:
+        base_url: Base URL of the Gatekeeper, e.g. http://1.2.3.4:8000.
+        concurrency: Maximum number of requests in flight.
+        rate: Target requests per second, or None for closed-loop.
+        duration: Duration of the test in seconds.
+        mix: Dict mapping endpoint to relative weight, defaults to DEFAULT_MIX.
+        num_rows: Number of rows that can be read back.
+        timeout: Per-request timeout in seconds.
+        batch_size: Number of items sent by each 'write-batch' request or read by each 'read-many' request.
+    Returns:
+        LoadStats of the run.
+    """
+    mix = mix or DEFAULT_MIX
+    endpoints = list(mix)
+    weights = [mix[endpoint] for endpoint in endpoints]
+    stats = LoadStats()
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        stats.start_time = time.monotonic()
+        if rate:
+            await _open_loop(session, base_url, endpoints, weights, num_rows, stats, rate, duration, concurrency,
+                             batch_size)
+        else:
+            deadline = stats.start_time + duration
+            await asyncio.gather(*[
+                _closed_loop(session, base_url, endpoints, weights, num_rows, stats, deadline, batch_size)
+                for _ in range(concurrency)
+            ])
+        stats.end_time = time.monotonic()
+
+    return stats
+
+
+def start_request_log(log_file, sample_rate=1.0, sample_rates=None):
+    """
+    Log every request as a JSON line to log_file from a background thread, so writing the
+    log does not delay the requests. Errors are always logged, successes can be sampled;
+    sampled records carry their rate, which Utilities/benchmark_analyzer.py scales back.
+    Args:
+        log_file: Path of the log.
+        sample_rate: Fraction of the successful requests of an endpoint logged.
+        sample_rates: Dict mapping endpoint to the fraction logged, overriding sample_rate.
+    Returns:
+        The started LogListener, stop it to write the pending records.
+    """
+    return start_queue_logging([logging.FileHandler(log_file)], sample_rate, sample_rates, key='endpoint')
+
+
+def write_results(results_file, stats, config=None):
+    """
+    Write the summary and latency histograms of a load test as JSON.
+    The histograms keep their bucket counts so runs can be merged and
+    re-analyzed with LatencyHistogram.from_dict.
+    Args:
+        results_file: Path of the JSON file to write.
+        stats: LoadStats returned by run_load_test.
+        config: Optional dict describing the test parameters.
+    """
+    with open(results_file, 'w') as file:
+        json.dump({
+            'config': config or {},
+            'summary': stats.summary(),
+            'histograms': stats.histograms(),
+        }, file, indent=2)
+    print(f"Benchmark results saved to {results_file}")
+
+
+def print_summary(summary):
+    """
+    Print the summary of a load test.
+    Args:
+        summary: Summary dict returned by LoadStats.summary.
+    """
+    print(f"Total Requests: {summary['total_requests']} ({summary['total_errors']} errors)")
+    print(f"Total Time: {summary['elapsed_seconds']:.2f} seconds")
+    print(f"Throughput: {summary['throughput']:.2f} requests/second")
+    for endpoint, counts in summary['endpoints'].items():
+        latency = counts['latency']
+        print(f"  {endpoint}: {counts['success']} success, {counts['error']} error, "
+              f"p50={latency['p50_ms']}ms p90={latency['p90_ms']}ms p99={latency['p99_ms']}ms "
+              f"p99.9={latency['p99_9_ms']}ms max={latency['max_ms']}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate load against the cluster Gatekeeper.")
+    parser.add_argument('gatekeeper_ip')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--rate', type=float, default=None, help="Target requests/second (open-loop)")
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--mix', default=None, help="e.g. random-read=3,write=1")
+    parser.add_argument('--num-rows', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=10, help="Items per write-batch or read-many request")
+    parser.add_argument('--results-file', default='benchmark_results.json')
+    parser.add_argument('--log-file', default='benchmark_log.txt')
+    parser.add_argument('--log-sample-rate', type=float, default=1.0, help="Fraction of the successful requests logged")
+    parser.add_argument('--log-sample-rates', default=None, help="Per endpoint, e.g. random-read=0.01,write=1")
+    args = parser.parse_args()
+
+    request_log = start_request_log(args.log_file, args.log_sample_rate,
+                                    parse_mix(args.log_sample_rates) if args.log_sample_rates else None)
+    config = {
+        'concurrency': args.concurrency,
+        'rate': args.rate,
+        'duration': args.duration,
+        'mix': parse_mix(args.mix) if args.mix else DEFAULT_MIX,
+        'num_rows': args.num_rows,
+        'batch_size': args.batch_size,
+    }
+    stats = asyncio.run(run_load_test(f"http://{args.gatekeeper_ip}:8000", **config))
+    request_log.stop()
+    print_summary(stats.summary())
+    write_results(args.results_file, stats, config)
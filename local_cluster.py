@@ -0,0 +1,467 @@
+import argparse
+import gzip
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import main_script
+
+# The services deployed by deploy_cluster run as local processes, each on its own loopback
+# address (127.0.0.x, all routed to lo on Linux) and port 8000 as on EC2, with one SQLite
+# database per shard standing in for the MySQL servers of its manager and workers.
+FIRST_HOST = 10  # Last byte of the first loopback address handed out
+NUM_ROWS = 200  # Actors in each stand-in database, as in Sakila
+START_TIMEOUT = 60  # Seconds to wait for the local cluster to answer end-to-end
+
+# Last names of the stand-in actors, shared by several of them so /search/ has matches
+LAST_NAMES = ['GUINESS', 'WAHLBERG', 'CHASE', 'DAVIS', 'LOLLOBRIGIDA', 'NICHOLSON', 'MOSTEL', 'JOHANSSON',
+              'SWANK', 'GABLE']
+
+# Parts of the user data scripts: the files they write under /home/ubuntu (service
+# modules, configuration and shard map) and the service they run
+HOME_DIR = '/home/ubuntu'
+HEREDOC_PATTERN = re.compile(r"cat <<\s*'?EOF'? > (\S+)\n(.*?)^EOF\n", re.S | re.M)
+SERVICE_PATTERN = re.compile(r"uvicorn (services\.\w+):app")
+
+# Stand-in for the parts of mysql.connector the manager and worker services use.
+# The database argument is the path of the SQLite file. The manager and workers of a
+# shard share it, so a worker sees every write at once and reports a running replication.
+SQLITE_CONNECTOR_CODE = '''
+import os
+import re
+import sqlite3
+
+class Error(Exception):
+    pass
+
+replica = os.environ.get("LOCAL_DB_REPLICA") == "1"
+insert_pattern = re.compile(r"\\s*INSERT INTO (\\w+) \\(([^)]*)\\) VALUES ", re.I)
+
+class Cursor:
+    def __init__(self, conn, dictionary=False):
+        self.conn = conn
+        self.dictionary = dictionary
+        self.cursor = conn.sqlite.cursor()
+        self.rows = None
+        self.lastrowid = None
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def _result(self, columns, rows):
+        self.rows = [dict(zip(columns, row)) if self.dictionary else tuple(row) for row in rows]
+
+    def execute(self, query, params=()):
+        self.rows = None
+        params = tuple(params or ())
+        statement = query.strip().upper()
+        try:
+            if statement.startswith("SHOW REPLICA STATUS"):
+                status = {"Replica_IO_Running": "Yes", "Replica_SQL_Running": "Yes", "Seconds_Behind_Source": 0}
+                self._result(list(status), [list(status.values())] if replica else [])
+            elif "@@GLOBAL.GTID_EXECUTED" in statement:
+                alias = re.search(r"AS (\\w+)", query, re.I)
+                self._result([alias.group(1) if alias else "gtid_executed"], [[self.conn.gtid_executed()]])
+            elif statement.startswith("SELECT WAIT_FOR_EXECUTED_GTID_SET"):
+                self._result(["waited"], [[0]])
+            elif insert_pattern.match(query):
+                self._insert(query, params)
+            else:
+                if not statement.startswith("SELECT"):
+                    self.conn.begin()
+                self.cursor.execute(query.replace("%s", "?"), params)
+                if self.cursor.description:
+                    self._result([column[0] for column in self.cursor.description], self.cursor.fetchall())
+                else:
+                    self.conn.writes += 1
+        except sqlite3.Error as e:
+            raise Error(str(e)) from e
+
+    def _insert(self, query, params):
+        # Like MySQL: lastrowid is the first id of a multi-row insert, and ids follow the
+        # auto_increment_increment and auto_increment_offset of the _settings table
+        match = insert_pattern.match(query)
+        table, columns = match.group(1), match.group(2)
+        width = len(columns.split(","))
+        rows = [params[start:start + width] for start in range(0, len(params), width)]
+        self.conn.begin()
+        increment, offset = self.cursor.execute(
+            "SELECT auto_increment_increment, auto_increment_offset FROM _settings").fetchone()
+        last_id = self.cursor.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+        first_id = last_id + (offset - last_id) % increment
+        if first_id <= last_id:
+            first_id += increment
+        values = ", ".join(["(" + ", ".join(["?"] * (width + 1)) + ")"] * len(rows))
+        self.cursor.execute(
+            f"INSERT INTO {table} (rowid, {columns}) VALUES {values}",
+            [value for index, row in enumerate(rows) for value in (first_id + index * increment, *row)],
+        )
+        self.conn.writes += 1
+        self.lastrowid = first_id
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows or [], []
+        return rows
+
+    def close(self):
+        self.cursor.close()
+
+class Connection:
+    def __init__(self, database=None, **kwargs):
+        self.sqlite = sqlite3.connect(database, timeout=30, isolation_level=None, check_same_thread=False)
+        self.writes = 0
+
+    def begin(self):
+        if not self.sqlite.in_transaction:
+            self.sqlite.execute("BEGIN IMMEDIATE")
+
+    def gtid_executed(self):
+        # Each committed write transaction gets the next GTID of the shard
+        source_uuid, transactions = self.sqlite.execute("SELECT source_uuid, transactions FROM _gtid").fetchone()
+        return f"{source_uuid}:1-{transactions}" if transactions else ""
+
+    def cursor(self, dictionary=False, **kwargs):
+        return Cursor(self, dictionary)
+
+    def commit(self):
+        if self.sqlite.in_transaction:
+            if self.writes:
+                self.sqlite.execute("UPDATE _gtid SET transactions = transactions + 1")
+            self.sqlite.execute("COMMIT")
+        self.writes = 0
+
+    def rollback(self):
+        if self.sqlite.in_transaction:
+            self.sqlite.execute("ROLLBACK")
+        self.writes = 0
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False, **kwargs):
+        self.sqlite.execute("SELECT 1")
+
+    def close(self):
+        self.sqlite.close()
+
+def connect(**kwargs):
+    return Connection(**kwargs)
+'''
+
+# Entry point of every local node: the service named by NODE_SERVICE behind an optional
+# delay on each request, standing in for the network hop into the node
+NODE_ENTRY_CODE = '''
+import asyncio
+import importlib
+import os
+import random
+
+node_app = importlib.import_module(os.environ["NODE_SERVICE"]).app
+
+hop_latency = float(os.environ.get("HOP_LATENCY_MS", 0)) / 1000
+hop_jitter = float(os.environ.get("HOP_JITTER_MS", 0)) / 1000
+
+async def app(scope, receive, send):
+    if scope["type"] == "http" and (hop_latency or hop_jitter):
+        await asyncio.sleep(hop_latency + random.uniform(0, hop_jitter))
+    await node_app(scope, receive, send)
+'''
+
+
+class LocalEC2:
+    """
+    Stand-in for the boto3 EC2 client passed to deploy_cluster. Instances are not launched:
+    their user data is recorded and they get the next loopback address as private and public IP.
+    """
+    def __init__(self, first_host=FIRST_HOST):
+        self.next_host = first_host
+        self.instances = {}
+
+    def run_instances(self, **kwargs):
+        name = kwargs['TagSpecifications'][0]['Tags'][0]['Value']
+        instance_id = f"local-{self.next_host}"
+        ip = f"127.0.0.{self.next_host}"
+        self.next_host += 1
+        self.instances[instance_id] = {'name': name, 'ip': ip, 'user_data': kwargs['UserData']}
+        return {'Instances': [{'InstanceId': instance_id, 'PrivateIpAddress': ip}]}
+
+    def get_waiter(self, name):
+        return LocalWaiter()
+
+    def describe_instances(self, InstanceIds):
+        instances = [
+            {'InstanceId': instance_id, 'State': {'Name': 'running'},
+             'PrivateIpAddress': self.instances[instance_id]['ip'], 'PublicIpAddress': self.instances[instance_id]['ip']}
+            for instance_id in InstanceIds
+        ]
+        return {'Reservations': [{'Instances': instances}]}
+
+
+class LocalWaiter:
+    def wait(self, **kwargs):
+        pass
+
+
+def node_role(name):
+    """
+    Args:
+        name: Name tag of an instance, e.g. 'worker1' or 'shard2-manager'.
+    Returns:
+        'manager', 'worker', 'proxy', 'trusted_host' or 'gatekeeper'.
+    """
+    for role in ('manager', 'worker'):
+        if role in name:
+            return role
+    return name
+
+
+def parse_latency(latency_spec):
+    """
+    Parse a per-role delay specification such as "proxy=1,worker=2.5".
+    Args:
+        latency_spec: Comma separated list of role=milliseconds pairs, None for no delay.
+    Returns:
+        Dict mapping role to milliseconds.
+    """
+    latency = {}
+    for part in (latency_spec or '').split(','):
+        if not part.strip():
+            continue
+        role, _, milliseconds = part.partition('=')
+        role = role.strip()
+        if role not in ('manager', 'worker', 'proxy', 'trusted_host', 'gatekeeper'):
+            raise ValueError(f"Unknown role in latency: {role}")
+        latency[role] = float(milliseconds)
+    return latency
+
+
+def create_database(path, shard_index, num_shards, num_rows=NUM_ROWS):
+    """
+    Create the SQLite database standing in for the MySQL servers of a shard: the Sakila
+    actor table with num_rows actors, the shard's auto-increment settings and its GTID counter.
+    Args:
+        path: Path of the database file.
+        shard_index: Index of the shard, from 0.
+        num_shards: Number of shards of the cluster.
+        num_rows: Number of actors.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE actor (actor_id INTEGER PRIMARY KEY, first_name TEXT NOT NULL, last_name TEXT NOT NULL,
+                            last_update TEXT DEFAULT CURRENT_TIMESTAMP);
+        CREATE INDEX idx_actor_last_name ON actor (last_name);
+        CREATE TABLE _settings (auto_increment_increment INTEGER, auto_increment_offset INTEGER);
+        CREATE TABLE _gtid (source_uuid TEXT, transactions INTEGER);
+    """)
+    conn.execute("INSERT INTO _settings VALUES (?, ?)", (num_shards, shard_index + 1))
+    conn.execute("INSERT INTO _gtid VALUES (?, 0)", (str(uuid.uuid4()),))
+    conn.executemany(
+        "INSERT INTO actor (actor_id, first_name, last_name) VALUES (?, ?, ?)",
+        [(actor_id, f"ACTOR{actor_id}", LAST_NAMES[actor_id % len(LAST_NAMES)]) for actor_id in range(1, num_rows + 1)]
+    )
+    conn.commit()
+    conn.close()
+
+
+class LocalCluster:
+    """
+    The cluster built by deploy_cluster, run on this machine. Every node runs the service
+    its user data unpacks, with its configuration; manager and workers use SQLite stand-ins for MySQL.
+    """
+    def __init__(self, workdir=None, num_workers=main_script.NUM_WORKERS, num_shards=main_script.NUM_SHARDS,
+                 latency=None, jitter=None, num_rows=NUM_ROWS):
+        """
+        Args:
+            workdir: Directory receiving the services, databases and logs, a new temporary one by default.
+            num_workers: Number of workers of each shard.
+            num_shards: Number of shards.
+            latency: Dict mapping role to the delay in ms added to each request the node receives.
+            jitter: Dict mapping role to the maximum random delay in ms added on top of it.
+            num_rows: Number of actors in each shard's database.
+        """
+        self.workdir = workdir or tempfile.mkdtemp(prefix='local_cluster_')
+        os.makedirs(self.workdir, exist_ok=True)
+        self.num_workers = num_workers
+        self.num_shards = num_shards
+        self.latency = latency or {}
+        self.jitter = jitter or {}
+        self.num_rows = num_rows
+        self.ec2_client = LocalEC2()
+        self.processes = {}
+        self.cluster = None
+
+    def _write_node(self, name, user_data):
+        # Returns the directory of the node and the module of its service
+        node_dir = os.path.join(self.workdir, name)
+        os.makedirs(node_dir, exist_ok=True)
+        user_data = gzip.decompress(user_data).decode()
+        for match in HEREDOC_PATTERN.finditer(user_data):
+            path = os.path.join(node_dir, os.path.relpath(match.group(1), HOME_DIR))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as file:
+                file.write(match.group(2))
+        with open(os.path.join(node_dir, 'local_node.py'), 'w') as file:
+            file.write(NODE_ENTRY_CODE)
+        return node_dir, SERVICE_PATTERN.search(user_data).group(1)
+
+    def _write_connector(self):
+        connector_dir = os.path.join(self.workdir, 'standin', 'mysql', 'connector')
+        os.makedirs(connector_dir, exist_ok=True)
+        open(os.path.join(connector_dir, '..', '__init__.py'), 'w').close()
+        with open(os.path.join(connector_dir, '__init__.py'), 'w') as file:
+            file.write(SQLITE_CONNECTOR_CODE)
+        return os.path.join(self.workdir, 'standin')
+
+    def start(self, timeout=START_TIMEOUT):
+        """
+        Generate the cluster with deploy_cluster, start every node and wait until the
+        Gatekeeper answers end-to-end.
+        Args:
+            timeout: Seconds to wait for the cluster to be ready.
+        Returns:
+            Dict returned by deploy_cluster, with the loopback IPs of the nodes.
+        """
+        # deploy_cluster saves the instance IDs relative to the working directory
+        cwd = os.getcwd()
+        os.chdir(self.workdir)
+        try:
+            self.cluster = main_script.deploy_cluster(self.ec2_client, 'local', 'local', 'local', 'local',
+                                                      self.num_workers, self.num_shards)
+        finally:
+            os.chdir(cwd)
+
+        standin_dir = self._write_connector()
+        databases = {}
+        for shard_index, shard in enumerate(self.cluster['shards']):
+            database = os.path.join(self.workdir, f'shard{shard_index + 1}.db')
+            create_database(database, shard_index, self.num_shards, self.num_rows)
+            databases[shard['manager_ip']] = database
+            databases.update({worker_ip: database for worker_ip in shard['worker_ips']})
+
+        # Database nodes first, then the forwarding tiers from the Proxy up
+        launch_time = time.time()
+        instances = sorted(self.ec2_client.instances.values(), key=lambda instance: instance['ip'] not in databases)
+        for instance in instances:
+            role = node_role(instance['name'])
+            env = dict(os.environ,
+                       HOP_LATENCY_MS=str(self.latency.get(role, 0)),
+                       HOP_JITTER_MS=str(self.jitter.get(role, 0)))
+            if instance['ip'] in databases:
+                env['PYTHONPATH'] = os.pathsep.join(filter(None, [standin_dir, env.get('PYTHONPATH')]))
+                env['DB_NAME'] = databases[instance['ip']]
+                env['LOCAL_DB_REPLICA'] = '1' if role == 'worker' else '0'
+            node_dir, env['NODE_SERVICE'] = self._write_node(instance['name'], instance['user_data'])
+            with open(os.path.join(self.workdir, f"{instance['name']}.log"), 'w') as log:
+                self.processes[instance['name']] = subprocess.Popen(
+                    [sys.executable, '-m', 'uvicorn', 'local_node:app', '--host', instance['ip'], '--port', '8000',
+                     '--log-level', 'warning'],
+                    cwd=node_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+                )
+        print(f"Started {len(self.processes)} local nodes in {self.workdir}")
+
+        try:
+            ready_after = main_script.wait_for_cluster_ready(self.cluster['gatekeeper_ip'], launch_time, timeout)
+        except TimeoutError:
+            exited = [name for name, process in self.processes.items() if process.poll() is not None]
+            self.stop()
+            if exited:
+                print(f"Nodes that exited, see their log in {self.workdir}: {', '.join(exited)}")
+            raise
+        main_script.print_readiness(ready_after)
+        return self.cluster
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def compare_strategies(gatekeeper_ip, strategies, concurrency=32, rate=None, duration=30, results_dir='.'):
+    """
+    Benchmark each read strategy on its own with the same load, then print them side by side.
+    Args:
+        gatekeeper_ip: IP of the Gatekeeper.
+        strategies: Endpoints of load_generator.READ_PATHS to compare.
+        concurrency: Maximum number of requests in flight.
+        rate: Target requests per second, or None for closed-loop.
+        duration: Duration of each benchmark in seconds.
+        results_dir: Directory receiving the results (JSON) and the request log of each strategy.
+    Returns:
+        Dict mapping strategy to the summary of its run.
+    """
+    summaries = {}
+    for strategy in strategies:
+        print(f"Benchmarking {strategy}...")
+        summaries[strategy] = main_script.benchmark_cluster(
+            gatekeeper_ip, concurrency, rate, duration, {strategy: 1},
+            results_file=os.path.join(results_dir, f'benchmark_{strategy}.json'),
+            log_file=os.path.join(results_dir, f'benchmark_log_{strategy}.txt')
+        )
+
+    print(f"{'Strategy':<12}  {'Req/second':>10}  {'Errors':>7}  {'p50 ms':>8}  {'p99 ms':>8}  {'p99.9 ms':>8}")
+    for strategy, summary in summaries.items():
+        latency = summary['latency']
+        print(f"{strategy:<12}  {summary['throughput']:>10.2f}  {summary['total_errors']:>7}  "
+              f"{latency['p50_ms']:>8}  {latency['p99_ms']:>8}  {latency['p99_9_ms']:>8}")
+    return summaries
+
+
+if __name__ == "__main__":
+    from load_generator import READ_PATHS, parse_mix
+
+    parser = argparse.ArgumentParser(description="Run the cluster as local processes and benchmark it.")
+    parser.add_argument('--workers', type=int, default=main_script.NUM_WORKERS, help="Workers per shard")
+    parser.add_argument('--shards', type=int, default=main_script.NUM_SHARDS)
+    parser.add_argument('--rows', type=int, default=NUM_ROWS, help="Actors in each shard's database")
+    parser.add_argument('--latency', default=None, help="Delay per hop into each role in ms, e.g. proxy=1,worker=2")
+    parser.add_argument('--jitter', default=None, help="Random extra delay per hop in ms, same format")
+    parser.add_argument('--workdir', default=None, help="Directory of the services, databases and logs")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--rate', type=float, default=None, help="Target requests/second (open-loop)")
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', default=None, help="e.g. random-read=3,write=1")
+    parser.add_argument('--compare-strategies', action='store_true', help="Benchmark each read strategy on its own")
+    parser.add_argument('--serve', action='store_true', help="Keep the cluster running until interrupted")
+    args = parser.parse_args()
+
+    cluster = LocalCluster(args.workdir, args.workers, args.shards, parse_latency(args.latency),
+                           parse_latency(args.jitter), args.rows)
+    with cluster:
+        gatekeeper_ip = cluster.cluster['gatekeeper_ip']
+        if args.serve:
+            print(f"Gatekeeper listening on http://{gatekeeper_ip}:8000, Ctrl+C to stop")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        elif args.compare_strategies:
+            compare_strategies(gatekeeper_ip, list(READ_PATHS), args.concurrency, args.rate, args.duration,
+                               cluster.workdir)
+        else:
+            main_script.benchmark_cluster(gatekeeper_ip, args.concurrency, args.rate, args.duration,
+                                          parse_mix(args.mix) if args.mix else None,
+                                          results_file=os.path.join(cluster.workdir, 'benchmark_results.json'),
+                                          log_file=os.path.join(cluster.workdir, 'benchmark_log.txt'))
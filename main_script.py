@@ -1,6 +1,9 @@
 import boto3
 import sys, os, time
 import json
+import gzip
+import io
+import tokenize
 from botocore.exceptions import ClientError
 import paramiko
 import time
@@ -9,12 +12,184 @@ import subprocess
 import requests
 import time
 import botocore.exceptions
-import logging
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from load_generator import run_load_test, print_summary, start_request_log, write_results
 
 # Initialize AWS clients
 ec2_client = boto3.client('ec2', region_name='us-east-1')
 s3_client = boto3.client('s3', region_name='us-east-1')
 
+# Keep-alive connection pool of the forwarding tiers (Gatekeeper, Trusted Host, Proxy)
+FORWARD_POOL_SIZE = 100  # Maximum connections to the next hop
+FORWARD_TIMEOUT = 10  # Seconds
+
+# Background latency prober of the Proxy, used by /ping-read/
+PROBE_INTERVAL = 1  # Seconds between two measurements of a worker
+PROBE_ALPHA = 0.3  # Weight of the newest measurement in the smoothed latency
+
+# Replication-aware read routing of the Proxy
+MAX_REPLICA_LAG = 5  # Seconds behind the manager before a worker leaves the read rotation
+LAG_CHECK_INTERVAL = 1  # Seconds between two replication checks of a worker
+RYW_TIMEOUT = 2  # Seconds a worker waits for a write's GTID before a read-your-writes read fails
+
+# Read-through cache of the Proxy
+CACHE_SIZE = 10000  # Maximum number of cached items, 0 disables the cache
+CACHE_TTL = 30  # Seconds an item stays cached
+
+# MySQL connection pool of the manager and worker apps, per uvicorn process
+DB_POOL_SIZE = 10  # Idle connections kept open
+DB_POOL_MAX_OVERFLOW = 10  # Extra connections opened under load
+DB_POOL_RECYCLE = 3600  # Seconds before a connection is replaced
+
+# Batched writes
+MAX_WRITE_BATCH = 1000  # Maximum number of items accepted by /write_batch
+GROUP_COMMIT_WINDOW = 0  # Milliseconds the manager waits to group single inserts, 0 disables it
+GROUP_COMMIT_MAX_BATCH = 100  # Maximum number of inserts committed together
+
+# Node images. Instances boot from the image baked for their role by bake_images when
+# AMI_FILE lists one, from the stock Ubuntu image otherwise.
+BASE_AMI_ID = 'ami-0e86e20dae9224db8'
+AMI_FILE = os.path.join('Utilities', 'ami_ids.json')
+BAKED_MARKER = '/opt/cluster/baked'
+
+# How workers get the manager's data: 'clone' copies its data directory with the MySQL
+# CLONE plugin, 'dump' imports a consistent mysqldump of it, 'sakila' loads Sakila locally.
+# 'clone' and 'dump' also carry the manager's GTID history over to the worker.
+SEED_MODE = 'clone'
+
+# Read replicas. Workers can also be added at runtime (setup_worker with proxy_ip) and
+# removed (remove_worker) through the Proxy admin API, without restarting it.
+NUM_WORKERS = 2  # Workers created at deployment
+DRAIN_TIMEOUT = 30  # Seconds a removed worker gets to finish its in-flight reads
+LATENCY_WINDOW = 1000  # Recent reads per worker the Proxy reports latency percentiles over
+
+# Sharding. Each shard is a manager with its own workers. The Proxy sends a write to the
+# shard given by a hash of the name and a read to the shard of its item_id: the manager of
+# shard k (from 0) only allocates ids equal to k + 1 modulo NUM_SHARDS. The Sakila actors
+# loaded at installation are in every shard, new items only in theirs.
+NUM_SHARDS = 1
+MAX_SEARCH_RESULTS = 1000  # Maximum number of rows a /search/ request can ask for
+MAX_READ_MANY = 1000  # Maximum number of item_ids in a /read_many request
+READ_MANY_CHUNK = 100  # item_ids the Proxy reads from one worker with one query
+
+# Readiness probing of the deployed cluster
+HEALTH_TIMEOUT = 2  # Seconds the Proxy waits for a health report, doubled and tripled up the chain
+READY_TIMEOUT = 900  # Seconds to wait for the whole chain to be ready
+READY_POLL_MAX_DELAY = 5  # Seconds between two health checks once the backoff is at its maximum
+
+# Request tracing, see services/tracing.py. The Gatekeeper samples requests and every tier
+# records the spans of the sampled ones in /home/ubuntu/traces.jsonl, where
+# Utilities/trace_analyzer.py reads them.
+TRACE_SAMPLE_RATE = 0.01  # Fraction of the requests traced end to end
+TRACE_COLLECTOR_URL = ''  # URL spans are also posted to as JSON lines, empty to keep them local
+
+# Logging. The services and the load generator write JSON lines from a background thread and
+# keep a sample of the records of each route, see services/logs.py. Warnings, errors and the
+# records of traced requests are always kept.
+LOG_SAMPLE_RATE = 0.01  # Fraction of the request records of the services kept
+LOG_SAMPLE_RATES = {}  # Route (e.g. '/write') to fraction kept, overriding LOG_SAMPLE_RATE
+
+# Services run by each role, see services/. Every role gets the modules it imports and
+# a JSON configuration file with its settings, the environment still overrides them.
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'services')
+SERVICE_FILES = {
+    'manager': ['__init__.py', 'config.py', 'health.py', 'metrics.py', 'tracing.py', 'models.py', 'db.py', 'manager.py'],
+    'worker': ['__init__.py', 'config.py', 'health.py', 'metrics.py', 'tracing.py', 'models.py', 'db.py', 'worker.py'],
+    'proxy': ['__init__.py', 'config.py', 'health.py', 'metrics.py', 'tracing.py', 'logs.py', 'models.py', 'forwarding.py', 'proxy.py'],
+    'trusted_host': ['__init__.py', 'config.py', 'health.py', 'metrics.py', 'tracing.py', 'logs.py', 'forwarding.py', 'trusted_host.py'],
+    'gatekeeper': ['__init__.py', 'config.py', 'health.py', 'metrics.py', 'tracing.py', 'logs.py', 'models.py', 'forwarding.py', 'gatekeeper.py'],
+}
+
+# Node setup that does not depend on the cluster layout. User data scripts run it on
+# every boot unless BAKED_MARKER exists, which is the case on images made by bake_images.
+MYSQL_INSTALL_SCRIPT = '''
+    sudo apt update -y
+    sudo apt install -y mysql-server wget python3-pip python3-venv
+
+    # Python dependencies of the app in a virtual environment
+    python3 -m venv /home/ubuntu/myenv
+    /home/ubuntu/myenv/bin/pip install fastapi uvicorn mysql-connector-python
+'''
+
+# Sakila is loaded before GTIDs are enabled and the binary logs are reset afterwards, so
+# nodes that load it themselves start with the same data and an empty GTID history.
+SAKILA_LOAD_SCRIPT = '''
+    # Load the Sakila database
+    wget -q https://downloads.mysql.com/docs/sakila-db.tar.gz
+    tar -xf sakila-db.tar.gz
+    sudo mysql < sakila-db/sakila-schema.sql
+    sudo mysql < sakila-db/sakila-data.sql
+    sudo mysql -e "RESET MASTER;"
+'''
+
+APP_INSTALL_SCRIPT = '''
+    sudo apt update -y
+    sudo apt install -y python3-pip python3.12-venv python3-setuptools
+
+    # Python dependencies of the app in a virtual environment
+    python3 -m venv /home/ubuntu/myenv
+    /home/ubuntu/myenv/bin/pip install --upgrade pip
+    /home/ubuntu/myenv/bin/pip install fastapi uvicorn httpx
+'''
+
+def strip_comments(source):
+    """
+    Blank the comment lines of a module, the bulk of what gzip cannot shrink in the Proxy's
+    user data. The lines are kept, so tracebacks on the nodes show the line numbers of the repo.
+    Args:
+        source: Python source code.
+    Returns:
+        The source without its comment lines.
+    """
+    lines = source.split('\n')
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        if token.type == tokenize.COMMENT and token.line.strip().startswith('#'):
+            lines[token.start[0] - 1] = ''
+    return '\n'.join(lines)
+
+def service_script(role, config):
+    """
+    Build the user data commands that write the service modules of a role and its
+    configuration, and start the service.
+    Args:
+        role: Key of SERVICE_FILES.
+        config: Dict of settings written to /home/ubuntu/cluster_config.json, see services/config.py.
+    Returns:
+        Bash commands.
+    """
+    # Tracing and logging are configured the same way on every tier
+    config = {**config, 'TRACE_SAMPLE_RATE': TRACE_SAMPLE_RATE, 'TRACE_COLLECTOR_URL': TRACE_COLLECTOR_URL,
+              'LOG_SAMPLE_RATE': LOG_SAMPLE_RATE, 'LOG_SAMPLE_RATES': LOG_SAMPLE_RATES}
+    modules = ''
+    for name in SERVICE_FILES[role]:
+        with open(os.path.join(SERVICES_DIR, name)) as file:
+            # Quoted delimiter: the module is written as is, without shell expansion
+            modules += f"    cat << 'EOF' > /home/ubuntu/services/{name}\n{strip_comments(file.read())}EOF\n"
+    return f'''
+    # Install the {role} service and its configuration
+    mkdir -p /home/ubuntu/services
+{modules}    cat << EOF > /home/ubuntu/cluster_config.json
+{json.dumps(config, indent=2)}
+EOF
+    chown -R ubuntu:ubuntu /home/ubuntu/services /home/ubuntu/cluster_config.json
+
+    # Run the service with Uvicorn in the virtual environment
+    cd /home/ubuntu && nohup /home/ubuntu/myenv/bin/uvicorn services.{role}:app --host 0.0.0.0 --port 8000 &
+'''
+
+def compress_user_data(user_data_script):
+    """
+    Compress a user data script carrying services. EC2 accepts at most 16 KB of user data,
+    which the modules of the Proxy alone exceed; cloud-init runs gzip compressed scripts.
+    The timestamp is fixed so the user data only changes with the script.
+    Args:
+        user_data_script: The bash script.
+    Returns:
+        Gzip compressed bytes of the script.
+    """
+    return gzip.compress(user_data_script.encode(), mtime=0)
+
 # Key pair management
 def retrieve_key_pair(ec2_client):
     """
@@ -177,43 +352,53 @@ def retrieve_subnet_id(ec2_client, vpc_id):
         sys.exit(1)
 
 # Set up the mysql clusters
-def setup_manager(ec2_client, key_pair_name, sg_id, subnet_id):
+def setup_manager(ec2_client, key_pair_name, sg_id, subnet_id,
+                  pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_MAX_OVERFLOW, recycle=DB_POOL_RECYCLE,
+                  group_commit_window=GROUP_COMMIT_WINDOW, group_commit_max_batch=GROUP_COMMIT_MAX_BATCH,
+                  max_write_batch=MAX_WRITE_BATCH, ami_id=None, manager_name='manager', server_id=1, shard_index=0, num_shards=1):
     instance_type = 't2.micro'
-    ami_id = 'ami-0e86e20dae9224db8'
+    ami_id = ami_id or get_role_ami('mysql')
+
+    # Settings of the manager service, see services/manager.py
+    manager_config = {
+        'DB_POOL_SIZE': pool_size,
+        'DB_POOL_MAX_OVERFLOW': max_overflow,
+        'DB_POOL_RECYCLE': recycle,
+        'AUTO_INCREMENT_INCREMENT': num_shards,
+        'GROUP_COMMIT_WINDOW': group_commit_window,
+        'GROUP_COMMIT_MAX_BATCH': group_commit_max_batch,
+        'MAX_WRITE_BATCH': max_write_batch,
+    }
 
     # User Data script to set up MySQL, FastAPI and configure replication for manager
-    user_data_script = '''#!/bin/bash
+    user_data_script = f'''#!/bin/bash
     exec > /var/log/user-data.log 2>&1
     set -x
-    # Updates the system and installs dependencies
-    sudo apt update -y
-    sudo apt install -y mysql-server wget python3-pip python3-venv
-
-    # Create a virtual environment for Python dependencies
-    python3 -m venv /home/ubuntu/myenv
+    # Install MySQL, Sakila and the Python dependencies unless the image has them
+    if [ ! -f {BAKED_MARKER} ]; then
+{MYSQL_INSTALL_SCRIPT}
+{SAKILA_LOAD_SCRIPT}
+    fi
     source /home/ubuntu/myenv/bin/activate
 
-    # Install FastAPI, Uvicorn, and MySQL connector in the virtual environment
-    pip install fastapi uvicorn mysql-connector-python
-
     # MySQL configuration
-    sudo sed -i '/\[mysqld\]/a server-id=1' /etc/mysql/mysql.conf.d/mysqld.cnf
+    sudo sed -i '/\[mysqld\]/a server-id={server_id}' /etc/mysql/mysql.conf.d/mysqld.cnf
     sudo sed -i '/\[mysqld\]/a gtid_mode=ON' /etc/mysql/mysql.conf.d/mysqld.cnf
     sudo sed -i '/\[mysqld\]/a enforce_gtid_consistency=ON' /etc/mysql/mysql.conf.d/mysqld.cnf
     sudo sed -i '/\[mysqld\]/a log_slave_updates=ON' /etc/mysql/mysql.conf.d/mysqld.cnf
     sudo sed -i '/\[mysqld\]/a binlog_format=ROW' /etc/mysql/mysql.conf.d/mysqld.cnf
     sudo sed -i 's/^bind-address\s*=.*$/bind-address = 0.0.0.0/' /etc/mysql/mysql.conf.d/mysqld.cnf
-    sudo systemctl restart mysql
+    sudo sed -i '/\[mysqld\]/a plugin-load-add=mysql_clone.so' /etc/mysql/mysql.conf.d/mysqld.cnf
 
-    # Load the Sakila database
-    wget https://downloads.mysql.com/docs/sakila-db.tar.gz
-    tar -xvf sakila-db.tar.gz
-    sudo mysql < sakila-db/sakila-schema.sql
-    sudo mysql < sakila-db/sakila-data.sql
+    # Shard {shard_index} of {num_shards}: the ids allocated here identify the shard
+    sudo sed -i '/\[mysqld\]/a auto_increment_increment={num_shards}' /etc/mysql/mysql.conf.d/mysqld.cnf
+    sudo sed -i '/\[mysqld\]/a auto_increment_offset={shard_index + 1}' /etc/mysql/mysql.conf.d/mysqld.cnf
+    sudo systemctl restart mysql
 
     # Create and configure the 'api_user' for MySQL connection
     sudo mysql -e "CREATE USER 'api_user'@'localhost' IDENTIFIED BY 'api_password';"
     sudo mysql -e "GRANT ALL PRIVILEGES ON sakila.* TO 'api_user'@'localhost';"
+    sudo mysql -e "GRANT REPLICATION CLIENT ON *.* TO 'api_user'@'localhost';"
     sudo mysql -e "FLUSH PRIVILEGES;"
 
     # Setup replication user for manager
@@ -225,50 +410,12 @@ def setup_manager(ec2_client, key_pair_name, sg_id, subnet_id):
     sudo mysql -e "ALTER USER 'repl'@'%' IDENTIFIED WITH mysql_native_password BY 'replica_password';"
     sudo mysql -e "FLUSH PRIVILEGES;"
 
-    # Create the FastAPI application file
-    cat <<EOF > /home/ubuntu/app.py
-from fastapi import FastAPI
-import mysql.connector
-from pydantic import BaseModel
-
-app = FastAPI()
-
-class Item(BaseModel):
-    column1: str
-    column2: str
-
-def get_db_connection():
-    conn = mysql.connector.connect(
-        host="localhost", 
-        user="api_user",  # Usando el usuario 'api_user'
-        password="api_password",  # Contraseña para 'api_user'
-        database="sakila"
-    )
-    return conn
-
-@app.post("/insert_item/")
-async def insert_item(item: Item):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    query = "INSERT INTO actor (first_name, last_name) VALUES (%s, %s)"
-    cursor.execute(query, (item.column1, item.column2))
-    conn.commit()
-    cursor.close()
-    conn.close()
-    return {"message": "Item inserted successfully"}
-EOF
-
-    source /home/ubuntu/myenv/bin/activate
-
-    # Change the file permissions to ensure its execution
-    chown ubuntu:ubuntu /home/ubuntu/app.py
-    chmod 755 /home/ubuntu/app.py
+    # Account workers seed from, with CLONE INSTANCE or mysqldump (see SEED_MODE).
+    # Created last so a worker that can log in finds the data and the other accounts.
+    sudo mysql -e "CREATE USER 'seed_user'@'%' IDENTIFIED WITH mysql_native_password BY 'seed_password';"
+    sudo mysql -e "GRANT BACKUP_ADMIN, SELECT, RELOAD, LOCK TABLES, SHOW VIEW, TRIGGER, EVENT, REPLICATION CLIENT ON *.* TO 'seed_user'@'%';"
 
-    # Run FastAPI application with Uvicorn in virtual environment
-    cd /home/ubuntu && nohup /home/ubuntu/myenv/bin/uvicorn app:app --host 0.0.0.0 --port 8000 --reload &
-    chmod +x /home/ubuntu/app.py
-    pip install fastapi uvicorn mysql-connector-python
-    nohup /home/ubuntu/myenv/bin/uvicorn app:app --host 0.0.0.0 --port 8000 &
+{service_script('manager', manager_config)}
     '''
 
     # Launch the manager instance
@@ -283,35 +430,95 @@ EOF
         TagSpecifications=[{
             'ResourceType': 'instance',
             'Tags': [
-                {'Key': 'Name', 'Value': 'manager'}
+                {'Key': 'Name', 'Value': manager_name}
             ]
         }],
-        UserData=user_data_script  # Pass the user_data script for manager
+        UserData=compress_user_data(user_data_script)  # Pass the user_data script for manager
     )
 
-    # Get the instance ID and private IP of the manager
+    # The private IP is assigned at launch, no need to wait for the instance to run
     manager_instance_id = instance['Instances'][0]['InstanceId']
-    print(f"Manager instance created with ID: {manager_instance_id}")
-
-    # Wait for the instance to be in running state
-    print("Waiting for manager instance to be in running state...")
-    ec2_client.get_waiter('instance_running').wait(InstanceIds=[manager_instance_id])
-
-    # Fetch private IP of the manager
-    manager_private_ip = ec2_client.describe_instances(InstanceIds=[manager_instance_id])['Reservations'][0]['Instances'][0]['PrivateIpAddress']
-    print(f"Manager's private IP: {manager_private_ip}")
+    manager_private_ip = instance['Instances'][0]['PrivateIpAddress']
+    print(f"Manager instance created with ID: {manager_instance_id} and IP: {manager_private_ip}")
 
     return manager_instance_id, manager_private_ip
 
-def setup_worker(ec2_client, key_pair_name, sg_id, subnet_id, manager_private_ip, worker_name, server_id):
+def worker_seed_script(seed_mode, manager_private_ip):
+    """
+    Build the user data commands that give a new worker the manager's data.
+    With 'clone' and 'dump' the worker's executed GTID set ends up equal to the manager's
+    at the time of the snapshot, so replication with MASTER_AUTO_POSITION resumes right
+    after it instead of replaying the manager's history.
+    Args:
+        seed_mode: 'clone', 'dump' or 'sakila', see SEED_MODE.
+        manager_private_ip: Private IP of the manager.
+    Returns:
+        Bash commands, empty for 'sakila' where the worker loaded Sakila during installation.
+    """
+    if seed_mode == 'clone':
+        # The server restarts by itself on the cloned data directory; the restart at the
+        # end covers the case where it is not supervised. Retry until the manager is up.
+        return f'''
+    # Clone the manager's data directory and GTID history
+    while ! sudo mysql -N -e "SELECT STATE FROM performance_schema.clone_status" 2>/dev/null | grep -q Completed; do
+        sudo mysql -e "SET GLOBAL clone_valid_donor_list = '{manager_private_ip}:3306'; CLONE INSTANCE FROM 'seed_user'@'{manager_private_ip}':3306 IDENTIFIED BY 'seed_password';" || sleep 10
+    done
+    sudo systemctl restart mysql
+'''
+    if seed_mode == 'dump':
+        # mysqldump sets GTID_PURGED to the manager's executed set, which requires an empty one here.
+        # The manager's accounts are not part of the dump, so the app account is created unlogged.
+        return f'''
+    # Import a consistent logical snapshot of the manager
+    until mysql -h {manager_private_ip} -u seed_user -pseed_password -e "SELECT 1"; do sleep 10; done
+    sudo mysql -e "RESET MASTER;"
+    mysqldump -h {manager_private_ip} -u seed_user -pseed_password --single-transaction --set-gtid-purged=ON --no-tablespaces --routines --triggers --events --databases sakila | sudo mysql
+    sudo mysql -e "SET sql_log_bin = 0; CREATE USER IF NOT EXISTS 'api_user'@'localhost' IDENTIFIED BY 'api_password'; GRANT ALL PRIVILEGES ON sakila.* TO 'api_user'@'localhost'; GRANT REPLICATION CLIENT ON *.* TO 'api_user'@'localhost';"
+'''
+    if seed_mode == 'sakila':
+        return ''
+    raise ValueError(f"Unknown seed mode: {seed_mode}")
+
+def worker_registration_script(proxy_ip, shard=0):
+    """
+    Build the user data commands that register a worker with the Proxy once it is set up.
+    The Proxy adds it to the read rotation when its replication has caught up.
+    Args:
+        proxy_ip: Private IP of the Proxy, None for the workers created with the cluster.
+        shard: Index of the shard whose manager the worker replicates.
+    Returns:
+        Bash commands, empty without a Proxy.
+    """
+    if not proxy_ip:
+        return ''
+    return f'''
+    # Register with the Proxy, retrying until it answers
+    WORKER_IP=$(hostname -I | awk '{{print $1}}')
+    until curl -sf -X POST http://{proxy_ip}:8000/admin/workers -H "Content-Type: application/json" -d '{{"worker_ip": "'"$WORKER_IP"'", "shard": {shard}}}'; do
+        sleep 10
+    done
+'''
+
+def setup_worker(ec2_client, key_pair_name, sg_id, subnet_id, manager_private_ip, worker_name, server_id,
+                 pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_MAX_OVERFLOW, recycle=DB_POOL_RECYCLE, ami_id=None,
+                 seed_mode=SEED_MODE, proxy_ip=None, shard=0):
     instance_type = 't2.micro'
-    ami_id = 'ami-0e86e20dae9224db8'
+    ami_id = ami_id or get_role_ami('mysql')
+
+    # Settings of the worker service, see services/worker.py
+    worker_config = {
+        'DB_POOL_SIZE': pool_size,
+        'DB_POOL_MAX_OVERFLOW': max_overflow,
+        'DB_POOL_RECYCLE': recycle,
+    }
 
     # User Data script to set up MySQL, FastAPI, and configure replication for workers
     user_data_script = f'''#!/bin/bash
-    # Update and install MySQL, Python, and dependencies
-    sudo apt update -y
-    sudo apt install -y mysql-server wget python3-pip python3-venv
+    # Install MySQL and the Python dependencies unless the image has them
+    if [ ! -f {BAKED_MARKER} ]; then
+{MYSQL_INSTALL_SCRIPT}
+{SAKILA_LOAD_SCRIPT if seed_mode == 'sakila' else ''}
+    fi
 
     # Set the server-id for the worker (should be unique, e.g., 2 for worker1, 3 for worker2)
     sudo sed -i '/\[mysqld\]/a server-id={server_id}' /etc/mysql/mysql.conf.d/mysqld.cnf
@@ -321,82 +528,13 @@ def setup_worker(ec2_client, key_pair_name, sg_id, subnet_id, manager_private_ip
     sudo sed -i '/\[mysqld\]/a enforce_gtid_consistency=ON' /etc/mysql/mysql.conf.d/mysqld.cnf
     sudo sed -i '/\[mysqld\]/a log_slave_updates=ON' /etc/mysql/mysql.conf.d/mysqld.cnf
     sudo sed -i '/\[mysqld\]/a binlog_format=ROW' /etc/mysql/mysql.conf.d/mysqld.cnf
+    sudo sed -i '/\[mysqld\]/a plugin-load-add=mysql_clone.so' /etc/mysql/mysql.conf.d/mysqld.cnf
     sudo systemctl restart mysql
-
-    # Download and load Sakila database on the worker
-    wget https://downloads.mysql.com/docs/sakila-db.tar.gz
-    tar -xvf sakila-db.tar.gz
-    if [ -f sakila-db/sakila-schema.sql ]; then
-        echo "Loading schema..."
-        sudo mysql < sakila-db/sakila-schema.sql
-    else
-        echo "Schema file not found."
-    fi
-
-    if [ -f sakila-db/sakila-data.sql ]; then
-        echo "Loading data..."
-        sudo mysql < sakila-db/sakila-data.sql
-    else
-        echo "Data file not found."
-    fi
-
+{worker_seed_script(seed_mode, manager_private_ip)}
     # Configure the worker to connect to the manager for replication
-    sudo mysql -e "CHANGE MASTER TO MASTER_HOST='{manager_private_ip}', MASTER_USER='repl', MASTER_PASSWORD='replica_password', MASTER_AUTO_POSITION=1; START SLAVE;"
-
-    # Create a Python virtual environment and install FastAPI
-    python3 -m venv /home/ubuntu/myenv
-    source /home/ubuntu/myenv/bin/activate
-
-    pip install fastapi uvicorn mysql-connector-python
-
-    # Create the FastAPI app to handle read requests
-    cat <<EOF > /home/ubuntu/app.py
-from fastapi import FastAPI
-import mysql.connector
-from pydantic import BaseModel
-
-app = FastAPI()
-
-class Item(BaseModel):
-    column1: str
-    column2: str
-
-def get_db_connection():
-    conn = mysql.connector.connect(
-        host="localhost", 
-        user="api_user",  # Using the same user for read access
-        password="api_password",  # Same password for 'api_user'
-        database="sakila"
-    )
-    return conn
-
-@app.get("/get_item/")
-async def get_item(item_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    query = "SELECT first_name, last_name FROM actor WHERE actor_id = %s"
-    cursor.execute(query, (item_id,))
-    result = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    if result:
-        return result;
-    else:
-        return {{"status": 200, "message": "Error"}}
-
-EOF
-
-    source /home/ubuntu/myenv/bin/activate
-
-    chown ubuntu:ubuntu /home/ubuntu/app.py
-    chmod 755 /home/ubuntu/app.py
-
-    # Run FastAPI application with Uvicorn in virtual environment
-    cd /home/ubuntu && nohup /home/ubuntu/myenv/bin/uvicorn app:app --host 0.0.0.0 --port 8000 --reload &
-    chmod +x /home/ubuntu/app.py
-    pip install fastapi uvicorn mysql-connector-python
-    nohup /home/ubuntu/myenv/bin/uvicorn app:app --host 0.0.0.0 --port 8000 &
+    sudo mysql -e "CHANGE MASTER TO MASTER_HOST='{manager_private_ip}', MASTER_USER='repl', MASTER_PASSWORD='replica_password', MASTER_AUTO_POSITION=1, MASTER_CONNECT_RETRY=10; START SLAVE;"
 
+{service_script('worker', worker_config)}{worker_registration_script(proxy_ip, shard)}
     '''
 
     # Launch the worker instance
@@ -411,125 +549,126 @@ EOF
         TagSpecifications=[{
             'ResourceType': 'instance',
             'Tags': [
-                {'Key': 'Name', 'Value': worker_name}
+                {'Key': 'Name', 'Value': worker_name},
+                # Read by the autoscaler to pick the server-id of the workers it adds
+                {'Key': 'ServerId', 'Value': str(server_id)},
+                {'Key': 'Shard', 'Value': str(shard)}
             ]
         }],
-        UserData=user_data_script  # Pass the user_data script for workers
+        UserData=compress_user_data(user_data_script)  # Pass the user_data script for workers
     )
 
-    # Get the instance ID of the worker
+    # The private IP is assigned at launch, no need to wait for the instance to run
     worker_instance_id = instance['Instances'][0]['InstanceId']
-    print(f"{worker_name} instance created with ID: {worker_instance_id}")
-
-    # Wait for the instance to be in running state
-    print(f"Waiting for {worker_name} instance to be in running state...")
-    ec2_client.get_waiter('instance_running').wait(InstanceIds=[worker_instance_id])
+    worker_private_ip = instance['Instances'][0]['PrivateIpAddress']
+    print(f"{worker_name} instance created with ID: {worker_instance_id} and IP: {worker_private_ip}")
 
-    # Fetch the private IP of the worker instance
-    worker_private_ip = ec2_client.describe_instances(InstanceIds=[worker_instance_id])['Reservations'][0]['Instances'][0]['PrivateIpAddress']
-    print(f"{worker_name}'s private IP: {worker_private_ip}")
+    return worker_instance_id, worker_private_ip
 
-    return worker_instance_id
+def setup_mysql_cluster(ec2_client, key_pair_name, sg_id, subnet_id, num_workers=NUM_WORKERS,
+                        seed_mode=SEED_MODE, shard_index=0, num_shards=1):
+    """
+    Launch the manager, then all the workers at once with the manager's IP.
+    No instance is waited for: the workers only need the manager's private IP.
+    Args:
+        ec2_client: The boto3 EC2 client.
+        key_pair_name: Key pair name to SSH into the instances.
+        sg_id: Security group ID.
+        subnet_id: Subnet ID.
+        num_workers: Number of workers, named worker1 to worker<num_workers>.
+        seed_mode: How the workers get the manager's data, see SEED_MODE.
+        shard_index: Index of the shard made of these instances, from 0.
+        num_shards: Number of shards of the cluster. With more than one, the instance
+            names start with shard<shard_index + 1>-.
+    Returns:
+        Tuple with the manager instance ID, the manager private IP, the worker instance IDs
+        and the worker private IPs.
+    """
+    name_prefix = f'shard{shard_index + 1}-' if num_shards > 1 else ''
+    first_server_id = shard_index * 100 + 1
 
-def setup_mysql_cluster(ec2_client, key_pair_name, sg_id, subnet_id):
     # Create the manager
-    manager_instance_id, manager_private_ip = setup_manager(ec2_client, key_pair_name, sg_id, subnet_id)
-
-    # Create workers and pass the manager's IP
-    worker_instance_ids = []
-    for i, worker_name in enumerate(['worker1', 'worker2'], start=2):  # Starting server-id from 2 for worker1
-        worker_instance_id = setup_worker(ec2_client, key_pair_name, sg_id, subnet_id, manager_private_ip, worker_name, i)
-        worker_instance_ids.append(worker_instance_id)
-
-    return manager_instance_id, worker_instance_ids
+    manager_instance_id, manager_private_ip = setup_manager(
+        ec2_client, key_pair_name, sg_id, subnet_id, manager_name=f'{name_prefix}manager',
+        server_id=first_server_id, shard_index=shard_index, num_shards=num_shards)
+
+    # Create workers in parallel and pass the manager's IP, with the server-ids following the manager's
+    worker_names = [f'{name_prefix}worker{i}' for i in range(1, num_workers + 1)]
+    with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+        workers = list(executor.map(
+            lambda args: setup_worker(ec2_client, key_pair_name, sg_id, subnet_id, manager_private_ip, *args,
+                                      seed_mode=seed_mode, shard=shard_index),
+            [(worker_name, i) for i, worker_name in enumerate(worker_names, start=first_server_id + 1)]
+        ))
+
+    worker_instance_ids = [worker_instance_id for worker_instance_id, _ in workers]
+    worker_private_ips = [worker_private_ip for _, worker_private_ip in workers]
+    return manager_instance_id, manager_private_ip, worker_instance_ids, worker_private_ips
 
 # Set up the proxy
-def setup_proxy(ec2_client, key_pair_name, sg_id, subnet_id, manager_ip, worker_ips):
-    user_data_script_proxy = f'''#!/bin/bash
-    sudo apt update -y
-    sudo apt install -y python3-pip python3.12-venv python3-setuptools
-    pip3 install fastapi uvicorn requests
-    cat << EOF > /home/ubuntu/app.py
-from fastapi import FastAPI
-import requests
-import random
-import subprocess
-import logging
-from pydantic import BaseModel
-
-logging.basicConfig(
-    level=logging.INFO,  # Set the log level to INFO or DEBUG depending on your needs
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
-
-# Create a logger
-logger = logging.getLogger(__name__)
-
-app = FastAPI()
-
-# Model for Item
-class Item(BaseModel):
-    column1: str
-    column2: str
-
-manager_ip = "{manager_ip}"
-worker_ips = {worker_ips}
-
-@app.post("/write")
-def write(item: Item):
-    logger.info(f"Received write request with item: {{item}}")
-    response = requests.post(f"http://{manager_ip}:8000/insert_item/", json=item.dict())  # Fixed the f-string formatting
-    logger.info(f"Successfully forwarded request to manager. Response: {{response.json()}}")
-    return response.json()
-
-@app.get("/random-read/")
-def random_read(item_id: int):
-    worker_ip = random.choice(worker_ips)
-    response = requests.get(f"http://{{worker_ip}}:8000/get_item/?item_id={{item_id}}")
-    return response.json()
-
-@app.get("/direct-read/")
-def direct_read(item_id: int):
-    worker_ip = worker_ips[0]
-    response = requests.get(f"http://{{worker_ip}}:8000/get_item/?item_id={{item_id}}")
-    return response.json()
-
-@app.get("/ping-read/")
-def ping_read(item_id: int):
-    ping_times = {{}}
-    for worker_ip in worker_ips:
-        ping_time = subprocess.check_output(["ping", "-c", "1", worker_ip]).decode().split("time=")[-1].split(" ")[0]
-        ping_times[worker_ip] = float(ping_time)
-    fastest_worker = min(ping_times, key=ping_times.get)
-    response = requests.get(f"http://{{fastest_worker}}:8000/get_item/?item_id={{item_id}}")
-    return response.json()
+def setup_proxy(ec2_client, key_pair_name, sg_id, subnet_id, shard_map,
+                pool_size=FORWARD_POOL_SIZE, timeout=FORWARD_TIMEOUT,
+                probe_interval=PROBE_INTERVAL, probe_alpha=PROBE_ALPHA,
+                max_lag=MAX_REPLICA_LAG, lag_check_interval=LAG_CHECK_INTERVAL, ryw_timeout=RYW_TIMEOUT,
+                cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL, health_timeout=HEALTH_TIMEOUT,
+                drain_timeout=DRAIN_TIMEOUT, latency_window=LATENCY_WINDOW, read_many_chunk=READ_MANY_CHUNK,
+                ami_id=None):
+    """
+    Deploy the Proxy instance routing writes to the managers and reads to the workers of each shard.
+    Args:
+        ec2_client: The boto3 EC2 client.
+        key_pair_name: Key pair name to SSH into the instance.
+        sg_id: Security group ID.
+        subnet_id: Subnet ID.
+        shard_map: Dict {"shards": [{"manager": <private IP>, "workers": [<private IPs>]}, ...]} with
+            the manager and workers created with each shard, more workers can register at runtime.
+            The Proxy keeps it in a file it reloads on POST /admin/shard-map/reload.
+        pool_size: Maximum number of keep-alive connections to the manager and workers.
+        timeout: Timeout in seconds of the forwarded requests.
+        probe_interval: Seconds between two latency measurements of a worker.
+        probe_alpha: Weight of the newest measurement in the smoothed worker latency.
+        max_lag: Replication lag in seconds above which a worker stops receiving reads.
+        lag_check_interval: Seconds between two replication checks of a worker.
+        ryw_timeout: Seconds a worker waits for the GTID of a write before a read-your-writes read fails.
+        cache_size: Maximum number of items in the read-through cache, 0 to disable it.
+        cache_ttl: Seconds an item stays in the read-through cache.
+        health_timeout: Seconds the Proxy waits for the health report of the manager or a worker.
+        drain_timeout: Seconds a removed worker gets to finish its in-flight reads.
+        latency_window: Number of recent reads per worker /worker-stats computes latency percentiles over.
+        read_many_chunk: Number of item_ids of a /read_many request read from one worker at once.
+        ami_id: Image to boot, defaults to the baked 'app' image or the stock Ubuntu image.
+    Returns:
+        Tuple with the Proxy instance ID and private IP.
+    """
+    # Settings of the proxy service, see services/proxy.py
+    proxy_config = {
+        'SHARD_MAP_FILE': 'shard_map.json',
+        'FORWARD_POOL_SIZE': pool_size,
+        'FORWARD_TIMEOUT': timeout,
+        'HEALTH_TIMEOUT': health_timeout,
+        'PROBE_INTERVAL': probe_interval,
+        'PROBE_ALPHA': probe_alpha,
+        'MAX_REPLICA_LAG': max_lag,
+        'LAG_CHECK_INTERVAL': lag_check_interval,
+        'RYW_TIMEOUT': ryw_timeout,
+        'CACHE_SIZE': cache_size,
+        'CACHE_TTL': cache_ttl,
+        'DRAIN_TIMEOUT': drain_timeout,
+        'LATENCY_WINDOW': latency_window,
+        'READ_MANY_CHUNK': read_many_chunk,
+    }
 
+    user_data_script_proxy = f'''#!/bin/bash
+    # Install the Python dependencies unless the image has them
+    if [ ! -f {BAKED_MARKER} ]; then
+{APP_INSTALL_SCRIPT}
+    fi
+    cat << EOF > /home/ubuntu/shard_map.json
+{json.dumps(shard_map, indent=2)}
 EOF
-
-    # Update package list
-    sudo apt update
-
-    # Install python3-venv if not installed
-    sudo apt install python3.12-venv
-
-    # Create the virtual environment
-    sudo python3 -m venv /home/ubuntu/myenv
-
-    # Activate the virtual environment
-    source /home/ubuntu/myenv/bin/activate
-
-    # Upgrade pip in the virtual environment
-    sudo /home/ubuntu/myenv/bin/pip install --upgrade pip
-
-    # Install the required Python packages
-    sudo /home/ubuntu/myenv/bin/pip install fastapi uvicorn mysql-connector-python requests
-
-    # Run the FastAPI application
-    cd /home/ubuntu
-    nohup /home/ubuntu/myenv/bin/uvicorn app:app --host 0.0.0.0 --port 8000 --reload &
-    
+{service_script('proxy', proxy_config)}
     '''
-    ami_id = 'ami-0e86e20dae9224db8'
+    ami_id = ami_id or get_role_ami('app')
 
     proxy_instance = ec2_client.run_instances(
         InstanceType='t2.large',
@@ -543,12 +682,13 @@ EOF
             'ResourceType': 'instance',
             'Tags': [{'Key': 'Name', 'Value': 'proxy'}]
         }],
-        UserData=user_data_script_proxy
+        UserData=compress_user_data(user_data_script_proxy)
     )
     proxy_instance_id = proxy_instance['Instances'][0]['InstanceId']
-    print(f"Proxy instance created with ID: {proxy_instance_id}")
+    proxy_private_ip = proxy_instance['Instances'][0]['PrivateIpAddress']
+    print(f"Proxy instance created with ID: {proxy_instance_id} and IP: {proxy_private_ip}")
 
-    return proxy_instance_id
+    return proxy_instance_id, proxy_private_ip
 
 # Get the public ip of an instance
 def get_public_ip(instance_id):
@@ -589,8 +729,98 @@ def get_private_ip(instance_id):
                 raise e
     raise Exception(f"Unable to retrieve private IP for instance {instance_id} after {retries} retries.")
 
+# Wait for several instances at once
+def wait_for_instances(ec2_client, instance_ids):
+    """
+    Wait until all the instances are running, polling them together with one describe call per attempt.
+    Args:
+        ec2_client: The boto3 EC2 client.
+        instance_ids: IDs of the instances to wait for.
+    Returns:
+        Dict mapping each instance ID to its description.
+    """
+    print(f"Waiting for {len(instance_ids)} instances to be in running state...")
+    ec2_client.get_waiter('instance_running').wait(
+        InstanceIds=instance_ids,
+        WaiterConfig={'Delay': 5, 'MaxAttempts': 120}
+    )
+    response = ec2_client.describe_instances(InstanceIds=instance_ids)
+    return {
+        instance['InstanceId']: instance
+        for reservation in response['Reservations']
+        for instance in reservation['Instances']
+    }
+
+def flatten_health(name, report):
+    """
+    Flatten a nested health report into one entry per node.
+    Args:
+        name: Name of the node that produced the report.
+        report: Health report returned by its /health endpoint.
+    Returns:
+        Dict mapping each node name to its own report.
+    """
+    nodes = {name: report}
+    for upstream_name, upstream_report in report.get('upstream', {}).items():
+        nodes.update(flatten_health(upstream_name, upstream_report))
+    return nodes
+
+def wait_for_cluster_ready(gatekeeper_ip, launch_time, timeout=READY_TIMEOUT, max_delay=READY_POLL_MAX_DELAY,
+                           health_timeout=HEALTH_TIMEOUT):
+    """
+    Poll the Gatekeeper /health endpoint with exponential backoff until the whole chain is ready.
+    Each tier checks the next one, and the Proxy checks the manager and every worker concurrently,
+    so one request covers uvicorn on every node, MySQL on the manager and workers and replication
+    on the workers.
+    Args:
+        gatekeeper_ip: Public IP of the Gatekeeper.
+        launch_time: time.time() at which the instances were launched.
+        timeout: Seconds to wait before giving up.
+        max_delay: Maximum seconds between two polls.
+        health_timeout: Health check timeout of the Proxy, see setup_gatekeeper.
+    Returns:
+        Dict mapping each node to the seconds it took to become ready after launch_time.
+    """
+    url = f"http://{gatekeeper_ip}:8000/health"
+    ready_after = {}
+    delay = 1
+    while True:
+        try:
+            report = requests.get(url, timeout=health_timeout * 4).json()
+        except (requests.RequestException, ValueError):
+            report = None
+
+        if report is not None:
+            for name, node in flatten_health('gatekeeper', report).items():
+                if node.get('ready') and name not in ready_after:
+                    # ready_since comes from the clock of the node itself
+                    ready_after[name] = max(node.get('ready_since') or time.time(), launch_time) - launch_time
+                    print(f"{name} ready after {ready_after[name]:.1f} seconds")
+            if report.get('healthy'):
+                print(f"Cluster answering end-to-end after {time.time() - launch_time:.1f} seconds")
+                return ready_after
+
+        if time.time() - launch_time > timeout:
+            pending = sorted(set(flatten_health('gatekeeper', report)) - set(ready_after)) if report else ['gatekeeper']
+            raise TimeoutError(f"Cluster not ready after {timeout} seconds, still waiting for: {', '.join(pending)}")
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+def print_readiness(ready_after):
+    """
+    Print how long each node took to become ready, slowest last.
+    Args:
+        ready_after: Dict returned by wait_for_cluster_ready.
+    """
+    print("Time to ready per node:")
+    for name, seconds in sorted(ready_after.items(), key=lambda entry: entry[1]):
+        print(f"  {name:<24} {seconds:>7.1f} s")
+
 # Set up the gatekeeper
-def setup_gatekeeper(ec2_client, key_pair_name, public_sg_id, private_sg_id, subnet_id, proxy_ip):
+def setup_gatekeeper(ec2_client, key_pair_name, public_sg_id, private_sg_id, subnet_id, proxy_ip,
+                     pool_size=FORWARD_POOL_SIZE, timeout=FORWARD_TIMEOUT, max_write_batch=MAX_WRITE_BATCH,
+                     health_timeout=HEALTH_TIMEOUT, max_search_results=MAX_SEARCH_RESULTS, max_read_many=MAX_READ_MANY,
+                     ami_id=None):
     """
     Deploy the Gatekeeper and Trusted Host instances and configure them with FastAPI to securely handle requests.
     Args:
@@ -599,88 +829,36 @@ def setup_gatekeeper(ec2_client, key_pair_name, public_sg_id, private_sg_id, sub
         sg_id: Security group ID.
         subnet_id: Subnet ID.
         proxy_ip: Public IP of the Proxy instance to which Trusted Host will forward requests.
+        pool_size: Maximum number of keep-alive connections of each tier to the next hop.
+        timeout: Timeout in seconds of the forwarded requests.
+        max_write_batch: Maximum number of items the Gatekeeper accepts in a /write_batch request.
+        health_timeout: Health check timeout of the Proxy, the Trusted Host and the Gatekeeper
+            wait two and three times as long for the report of their next hop.
+        max_search_results: Maximum number of rows the Gatekeeper lets a /search/ request ask for.
+        max_read_many: Maximum number of item_ids the Gatekeeper accepts in a /read_many request.
+        ami_id: Image to boot, defaults to the baked 'app' image or the stock Ubuntu image.
     Returns:
         Tuple with Gatekeeper and Trusted Host instance IDs.
     """
+    # Settings of the trusted host service, see services/trusted_host.py
+    trusted_host_config = {
+        'PROXY_IP': proxy_ip,
+        'FORWARD_POOL_SIZE': pool_size,
+        'FORWARD_TIMEOUT': timeout,
+        'HEALTH_TIMEOUT': health_timeout * 2,
+    }
+
     # Script to configure the Trusted Host with FastAPI to handle requests from Gatekeeper
     user_data_script_trusted_host = f'''#!/bin/bash
-    sudo apt update -y
-    sudo apt install -y python3-pip python3.12-venv python3-setuptools
-    pip3 install fastapi uvicorn requests
-    cat << EOF > /home/ubuntu/app.py
-from fastapi import FastAPI
-import requests
-import random
-import subprocess
-import logging
-from pydantic import BaseModel
-
-logging.basicConfig(
-    level=logging.INFO,  # Set the log level to INFO or DEBUG depending on your needs
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
-
-# Create a logger
-logger = logging.getLogger(__name__)
-
-app = FastAPI()
-
-# Modelo Item
-class Item(BaseModel):
-    column1: str
-    column2: str
-
-proxy_ip = "{proxy_ip}"
-
-@app.post("/write")
-def write(item: Item):
-    logger.info(f"Received write request with item: {{item}}")
-    response = requests.post(f"http://{proxy_ip}:8000/write", json=item.dict())
-    return response.json()
-
-@app.get("/random-read/")
-def random_read(item_id: int):
-    response = requests.get(f"http://{proxy_ip}:8000/random-read/?item_id={{item_id}}")
-    return response.json()
-
-@app.get("/direct-read/")
-def direct_read(item_id: int):
-    response = requests.get(f"http://{proxy_ip}:8000/direct-read/?item_id={{item_id}}")
-    return response.json()
-
-@app.get("/ping-read/")
-def ping_read(item_id: int):
-    response = requests.get(f"http://{proxy_ip}:8000/ping-read/?item_id={{item_id}}")
-    return response.json()
-
-EOF
-
-    # Update package list
-    sudo apt update
-
-    # Install python3-venv if not installed
-    sudo apt install python3.12-venv
-
-    # Create the virtual environment
-    sudo python3 -m venv /home/ubuntu/myenv
-
-    # Activate the virtual environment
-    source /home/ubuntu/myenv/bin/activate
-
-    # Upgrade pip in the virtual environment
-    sudo /home/ubuntu/myenv/bin/pip install --upgrade pip
-
-    # Install the required Python packages
-    sudo /home/ubuntu/myenv/bin/pip install fastapi uvicorn mysql-connector-python requests
-
-    # Run the FastAPI application
-    cd /home/ubuntu
-    nohup /home/ubuntu/myenv/bin/uvicorn app:app --host 0.0.0.0 --port 8000 --reload &
-    
+    # Install the Python dependencies unless the image has them
+    if [ ! -f {BAKED_MARKER} ]; then
+{APP_INSTALL_SCRIPT}
+    fi
+{service_script('trusted_host', trusted_host_config)}
     '''
 
     # Launch the Trusted Host instance
-    ami_id = 'ami-0e86e20dae9224db8'
+    ami_id = ami_id or get_role_ami('app')
 
     trusted_host_instance = ec2_client.run_instances(
         InstanceType='t2.large',
@@ -694,92 +872,33 @@ EOF
             'ResourceType': 'instance',
             'Tags': [{'Key': 'Name', 'Value': 'trusted_host'}]
         }],
-        UserData=user_data_script_trusted_host
+        UserData=compress_user_data(user_data_script_trusted_host)
     )
     trusted_host_instance_id = trusted_host_instance['Instances'][0]['InstanceId']
-    ec2_client.get_waiter('instance_running').wait(InstanceIds=[trusted_host_instance_id])
-    trusted_host_ip = get_private_ip(trusted_host_instance_id)
+    trusted_host_ip = trusted_host_instance['Instances'][0]['PrivateIpAddress']
     print(f"Trusted Host instance created with ID: {trusted_host_instance_id} and IP: {trusted_host_ip}")
 
+    # Settings of the gatekeeper service, see services/gatekeeper.py
+    gatekeeper_config = {
+        'TRUSTED_HOST_IP': trusted_host_ip,
+        'FORWARD_POOL_SIZE': pool_size,
+        'FORWARD_TIMEOUT': timeout,
+        'HEALTH_TIMEOUT': health_timeout * 3,
+        'MAX_WRITE_BATCH': max_write_batch,
+        'MAX_SEARCH_RESULTS': max_search_results,
+        'MAX_READ_MANY': max_read_many,
+    }
+
     # Script to configure the Gatekeeper with FastAPI to validate requests and forward to Trusted Host
     user_data_script_gatekeeper = f'''#!/bin/bash
-    sudo apt update -y
-    sudo apt install -y python3-pip python3.12-venv python3-setuptools
-    pip3 install fastapi uvicorn requests
-    cat << EOF > /home/ubuntu/app.py
-from fastapi import FastAPI
-import requests
-import random
-import subprocess
-import logging
-from pydantic import BaseModel
-
-logging.basicConfig(
-    level=logging.INFO,  # Set the log level to INFO or DEBUG depending on your needs
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
-
-# Create a logger
-logger = logging.getLogger(__name__)
-
-app = FastAPI()
-
-# Model for Item
-class Item(BaseModel):
-    column1: str
-    column2: str
-
-trusted_host_ip = "{trusted_host_ip}"
-
-@app.post("/write")
-def write(item: Item):
-    logger.info(f"Received write request with item: {{item}}")
-    response = requests.post(f"http://{trusted_host_ip}:8000/write", json=item.dict())
-    return response.json()
-
-@app.get("/random-read/")
-def random_read(item_id: int):
-    response = requests.get(f"http://{trusted_host_ip}:8000/random-read/?item_id={{item_id}}")
-    return response.json()
-
-@app.get("/direct-read/")
-def direct_read(item_id: int):
-    response = requests.get(f"http://{trusted_host_ip}:8000/direct-read/?item_id={{item_id}}")
-    return response.json()
-
-@app.get("/ping-read/")
-def ping_read(item_id: int):
-    response = requests.get(f"http://{trusted_host_ip}:8000/ping-read/?item_id={{item_id}}")
-    return response.json()
-
-EOF
-
-    # Update package list
-    sudo apt update
-
-    # Install python3-venv if not installed
-    sudo apt install python3.12-venv
-
-    # Create the virtual environment
-    sudo python3 -m venv /home/ubuntu/myenv
-
-    # Activate the virtual environment
-    source /home/ubuntu/myenv/bin/activate
-
-    # Upgrade pip in the virtual environment
-    sudo /home/ubuntu/myenv/bin/pip install --upgrade pip
-
-    # Install the required Python packages
-    sudo /home/ubuntu/myenv/bin/pip install fastapi uvicorn mysql-connector-python requests
-
-    # Run the FastAPI application
-    cd /home/ubuntu
-    nohup /home/ubuntu/myenv/bin/uvicorn app:app --host 0.0.0.0 --port 8000 --reload &
-    
+    # Install the Python dependencies unless the image has them
+    if [ ! -f {BAKED_MARKER} ]; then
+{APP_INSTALL_SCRIPT}
+    fi
+{service_script('gatekeeper', gatekeeper_config)}
     '''
 
     # Launch the Gatekeeper instance
-    ami_id = 'ami-0e86e20dae9224db8'
 
     gatekeeper_instance = ec2_client.run_instances(
         InstanceType='t2.large',
@@ -793,70 +912,51 @@ EOF
             'ResourceType': 'instance',
             'Tags': [{'Key': 'Name', 'Value': 'gatekeeper'}]
         }],
-        UserData=user_data_script_gatekeeper
+        UserData=compress_user_data(user_data_script_gatekeeper)
     )
     gatekeeper_instance_id = gatekeeper_instance['Instances'][0]['InstanceId']
-    ec2_client.get_waiter('instance_running').wait(InstanceIds=[gatekeeper_instance_id])
-    gatekeeper_ip = get_public_ip(gatekeeper_instance_id)
-    print(f"Gatekeeper instance created with ID: {gatekeeper_instance_id} and IP: {gatekeeper_ip}")
+    print(f"Gatekeeper instance created with ID: {gatekeeper_instance_id}")
 
     # Security configuration to ensure only Gatekeeper can communicate with Trusted Host
     #configure_gatekeeper_security(ec2_client, sg_id, trusted_host_ip)
 
     return gatekeeper_instance_id, trusted_host_instance_id
 
-# Set up logging configuration
-logging.basicConfig(filename='Utilities\\benchmark_log.txtbenchmark_log.txt', level=logging.INFO, 
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-
 # Benchmarking
-def benchmark_cluster(gatekeeper_ip):
+def benchmark_cluster(gatekeeper_ip, concurrency=32, rate=None, duration=60, mix=None,
+                      results_file=os.path.join('Utilities', 'benchmark_results.json'),
+                      log_file=os.path.join('Utilities', 'benchmark_log.txt'), log_sample_rate=1.0):
     """
-    Sends 1000 read and 1000 write requests to the MySQL cluster.
+    Generate concurrent load against the MySQL cluster through the Gatekeeper.
+    Every request is timed with a monotonic clock and recorded in a latency
+    histogram per endpoint, which are saved with the summary in `results_file`.
+    Args:
+        gatekeeper_ip: Public IP of the Gatekeeper.
+        concurrency: Maximum number of requests in flight.
+        rate: Target requests per second (open-loop), or None to send back to back (closed-loop).
+        duration: Duration of the benchmark in seconds.
+        mix: Dict mapping endpoint ('write' or a read strategy of load_generator.READ_PATHS) to relative weight.
+        results_file: Path of the JSON file receiving the summary and latency histograms.
+        log_file: Path of the request log, one JSON line per logged request.
+        log_sample_rate: Fraction of the successful requests logged, errors are always logged.
+    Returns:
+        Summary dict of the run.
     """
-    num_rows = 50
-    for _ in range(1000):
-        item_id = random.randint(1, num_rows)  # Random item_id within the range of your rows
-        try:
-            response = requests.get(f"http://{gatekeeper_ip}:8000/ping-read/?item_id={item_id}")
-            response.raise_for_status()  # Raise an exception for HTTP errors
-            logging.info(f"ping-read success - item_id={item_id}, status_code={response.status_code}")
-        except requests.exceptions.RequestException as e:
-            logging.error(f"ping-read error - item_id={item_id}, error={str(e)}")
-    
-    for _ in range(1000):
-        item_id = random.randint(1, num_rows)  # Random item_id for random-read
-        try:
-            response = requests.get(f"http://{gatekeeper_ip}:8000/random-read/?item_id={item_id}")
-            response.raise_for_status()
-            logging.info(f"random-read success - item_id={item_id}, status_code={response.status_code}")
-        except requests.exceptions.RequestException as e:
-            logging.error(f"random-read error - item_id={item_id}, error={str(e)}")
-    
-    for _ in range(1000):
-        item_id = random.randint(1, num_rows)  # Random item_id for direct-read
-        try:
-            response = requests.get(f"http://{gatekeeper_ip}:8000/direct-read/?item_id={item_id}")
-            response.raise_for_status()
-            logging.info(f"direct-read success - item_id={item_id}, status_code={response.status_code}")
-        except requests.exceptions.RequestException as e:
-            logging.error(f"direct-read error - item_id={item_id}, error={str(e)}")
-
-    # Send 1000 POST requests with dynamic column1, column2 values for write requests
-    for _ in range(1000):
-        column1 = f"Name{random.randint(1, 100)}"
-        column2 = f"Surname{random.randint(1, 100)}"
-        data = {
-            'column1': column1,
-            'column2': column2
-        }
-        headers = {'Content-Type': 'application/json'}
-        try:
-            response = requests.post(f"http://{gatekeeper_ip}:8000/write", data=json.dumps(data), headers=headers)
-            response.raise_for_status()
-            logging.info(f"write success - column1={column1}, column2={column2}, status_code={response.status_code}")
-        except requests.exceptions.RequestException as e:
-            logging.error(f"write error - column1={column1}, column2={column2}, error={str(e)}")
+    config = {
+        'concurrency': concurrency,
+        'rate': rate,
+        'duration': duration,
+        'mix': mix,
+    }
+    request_log = start_request_log(log_file, log_sample_rate)
+    try:
+        stats = asyncio.run(run_load_test(f"http://{gatekeeper_ip}:8000", **config))
+    finally:
+        request_log.stop()
+    summary = stats.summary()
+    print_summary(summary)
+    write_results(results_file, stats, config)
+    return summary
 
 def create_public_security_group(ec2_client, vpc_id, description="Public Security Group"):
     """
@@ -985,15 +1085,196 @@ def create_private_security_group(ec2_client, vpc_id, public_security_group_id,
         
 INSTANCE_FILE = "Utilities\instance_ids.json"
 
-def save_instance_ids(manager_id, worker_ids):
+def save_instance_ids(shards):
     data = {
-        "manager_id": manager_id,
-        "worker_ids": worker_ids
+        "shards": [
+            {"manager_id": shard['manager_id'], "worker_ids": shard['worker_ids']}
+            for shard in shards
+        ]
     }
     with open(INSTANCE_FILE, "w") as file:
         json.dump(data, file)
     print(f"Instance IDs saved to {INSTANCE_FILE}")
 
+def get_role_ami(role):
+    """
+    Get the image instances of a role boot from.
+    Args:
+        role: 'mysql' for the manager and workers, 'app' for the Proxy, Trusted Host and Gatekeeper.
+    Returns:
+        AMI ID baked for the role by bake_images, or BASE_AMI_ID if there is none.
+    """
+    if os.path.exists(AMI_FILE):
+        with open(AMI_FILE, "r") as file:
+            ami_ids = json.load(file)
+        if role in ami_ids:
+            return ami_ids[role]
+    return BASE_AMI_ID
+
+# Run last on the bake builders. MySQL is stopped and its server UUID removed so that
+# every instance started from the image generates its own, which replication requires.
+BAKE_FINALIZE_SCRIPT = f'''
+    if [ -d /var/lib/mysql ]; then
+        sudo systemctl stop mysql
+        sudo rm -f /var/lib/mysql/auto.cnf
+    fi
+    sudo mkdir -p {os.path.dirname(BAKED_MARKER)}
+    sudo touch {BAKED_MARKER}
+    sudo shutdown -h now
+'''
+
+def bake_images(ec2_client, key_pair_name, sg_id, subnet_id):
+    """
+    Build one image per role with the packages, Python virtual environment and (for 'mysql')
+    the Sakila database already installed, so nodes booted from them skip straight to their
+    configuration and do not need network access to package repositories.
+    The builder instances run in parallel and are terminated once their image is available.
+    Args:
+        ec2_client: The boto3 EC2 client.
+        key_pair_name: Key pair name to SSH into the builder instances.
+        sg_id: Security group ID of the builder instances.
+        subnet_id: Subnet ID, the builders need outbound internet access.
+    Returns:
+        Dict mapping each role to its AMI ID, also saved to AMI_FILE.
+    """
+    start_time = time.time()
+    install_scripts = {'mysql': MYSQL_INSTALL_SCRIPT + SAKILA_LOAD_SCRIPT, 'app': APP_INSTALL_SCRIPT}
+
+    builder_ids = {}
+    for role, install_script in install_scripts.items():
+        # set -e: a failed install never reaches the shutdown, so no broken image is made
+        user_data_script = f'''#!/bin/bash
+    exec > /var/log/user-data.log 2>&1
+    set -ex
+{install_script}
+{BAKE_FINALIZE_SCRIPT}
+    '''
+        instance = ec2_client.run_instances(
+            ImageId=BASE_AMI_ID,
+            InstanceType='t2.micro',
+            KeyName=key_pair_name,
+            SecurityGroupIds=[sg_id],
+            SubnetId=subnet_id,
+            MinCount=1,
+            MaxCount=1,
+            TagSpecifications=[{
+                'ResourceType': 'instance',
+                'Tags': [{'Key': 'Name', 'Value': f'bake-{role}'}]
+            }],
+            UserData=user_data_script
+        )
+        builder_ids[role] = instance['Instances'][0]['InstanceId']
+        print(f"Builder for the '{role}' image created with ID: {builder_ids[role]}")
+
+    # The builders power themselves off once the installation is done
+    print("Waiting for the builder instances to finish and stop...")
+    ec2_client.get_waiter('instance_stopped').wait(
+        InstanceIds=list(builder_ids.values()),
+        WaiterConfig={'Delay': 15, 'MaxAttempts': 120}
+    )
+
+    ami_ids = {}
+    for role, builder_id in builder_ids.items():
+        image = ec2_client.create_image(
+            InstanceId=builder_id,
+            Name=f"log8415-{role}-{int(time.time())}",
+            Description=f"LOG8415 cluster {role} node"
+        )
+        ami_ids[role] = image['ImageId']
+        print(f"Image for the '{role}' role: {ami_ids[role]}")
+
+    print("Waiting for the images to be available...")
+    ec2_client.get_waiter('image_available').wait(
+        ImageIds=list(ami_ids.values()),
+        WaiterConfig={'Delay': 15, 'MaxAttempts': 120}
+    )
+    ec2_client.terminate_instances(InstanceIds=list(builder_ids.values()))
+
+    with open(AMI_FILE, "w") as file:
+        json.dump(ami_ids, file, indent=2)
+    print(f"Images baked in {time.time() - start_time:.1f} seconds and saved to {AMI_FILE}")
+    return ami_ids
+
+def remove_worker(ec2_client, proxy_ip, worker_instance_id, worker_ip, timeout=DRAIN_TIMEOUT):
+    """
+    Drain a worker through the Proxy admin API, then terminate it.
+    The admin API is on the Proxy private IP, so this must run from inside the VPC.
+    Args:
+        ec2_client: The boto3 EC2 client.
+        proxy_ip: Private IP of the Proxy.
+        worker_instance_id: Instance ID of the worker.
+        worker_ip: Private IP of the worker.
+        timeout: Seconds to wait for the worker to leave the Proxy.
+    """
+    admin_url = f"http://{proxy_ip}:8000/admin/workers"
+    response = requests.delete(f"{admin_url}/{worker_ip}", timeout=10)
+    if response.status_code != 404:
+        response.raise_for_status()
+        deadline = time.time() + timeout + 10
+        while worker_ip in requests.get(admin_url, timeout=10).json() and time.time() < deadline:
+            time.sleep(1)
+    ec2_client.terminate_instances(InstanceIds=[worker_instance_id])
+    print(f"Worker {worker_instance_id} ({worker_ip}) drained and terminated")
+
+def deploy_cluster(ec2_client, key_pair_name, public_sg_id, private_sg_id, subnet_id, num_workers=NUM_WORKERS,
+                   num_shards=NUM_SHARDS):
+    """
+    Launch every instance of the cluster without waiting in between.
+    Private IPs are known as soon as run_instances returns, so each tier is launched
+    with the IPs of the next one right away and all the instances boot in parallel.
+    The only wait is a single batched one at the end, for the Gatekeeper's public IP.
+    Args:
+        ec2_client: The boto3 EC2 client.
+        key_pair_name: Key pair name to SSH into the instances.
+        public_sg_id: ID of the public security group (Gatekeeper).
+        private_sg_id: ID of the private security group (every other instance).
+        subnet_id: Subnet ID.
+        num_workers: Number of workers of each shard.
+        num_shards: Number of shards, each with its own manager and workers.
+    Returns:
+        Dict with the launch time, the instance IDs and private IPs of the manager and workers
+        of each shard, the shard map given to the Proxy, the ID of every other instance, the
+        private IP of the Proxy and the public IP of the Gatekeeper.
+    """
+    start_time = time.time()
+
+    # The shards do not depend on each other and are launched in parallel
+    with ThreadPoolExecutor(max_workers=num_shards) as executor:
+        shards = [
+            {'manager_id': manager_id, 'manager_ip': manager_ip, 'worker_ids': worker_ids, 'worker_ips': worker_ips}
+            for manager_id, manager_ip, worker_ids, worker_ips in executor.map(
+                lambda shard_index: setup_mysql_cluster(ec2_client, key_pair_name, private_sg_id, subnet_id,
+                                                        num_workers, shard_index=shard_index, num_shards=num_shards),
+                range(num_shards)
+            )
+        ]
+    save_instance_ids(shards)
+
+    shard_map = {'shards': [{'manager': shard['manager_ip'], 'workers': shard['worker_ips']} for shard in shards]}
+    proxy_instance_id, proxy_ip = setup_proxy(ec2_client, key_pair_name, private_sg_id, subnet_id, shard_map)
+    gatekeeper_instance_id, trusted_host_id = setup_gatekeeper(
+        ec2_client, key_pair_name, public_sg_id, private_sg_id, subnet_id, proxy_ip)
+    print(f"All instances launched in {time.time() - start_time:.1f} seconds")
+
+    instance_ids = [
+        *(instance_id for shard in shards for instance_id in [shard['manager_id'], *shard['worker_ids']]),
+        proxy_instance_id, trusted_host_id, gatekeeper_instance_id,
+    ]
+    instances = wait_for_instances(ec2_client, instance_ids)
+    gatekeeper_ip = instances[gatekeeper_instance_id].get('PublicIpAddress')
+    print(f"All instances running in {time.time() - start_time:.1f} seconds, Gatekeeper public IP: {gatekeeper_ip}")
+
+    return {
+        'launch_time': start_time,
+        'shards': shards,
+        'shard_map': shard_map,
+        'proxy_ip': proxy_ip,
+        'proxy_id': proxy_instance_id,
+        'trusted_host_id': trusted_host_id,
+        'gatekeeper_id': gatekeeper_instance_id,
+        'gatekeeper_ip': gatekeeper_ip,
+    }
+
 def main():
     key_pair_name = retrieve_key_pair(ec2_client)
 
@@ -1003,19 +1284,26 @@ def main():
     public_sg_id = create_public_security_group(ec2_client, vpc_id)
     private_sg_id = create_private_security_group(ec2_client, vpc_id, public_sg_id)
 
-    manager_instance_id, worker_instance_ids = setup_mysql_cluster(ec2_client, key_pair_name, private_sg_id, subnet_id)
-    save_instance_ids(manager_instance_id, worker_instance_ids)
+    cluster = deploy_cluster(ec2_client, key_pair_name, public_sg_id, private_sg_id, subnet_id)
 
-    manager_ip = get_private_ip(manager_instance_id)
-    worker_ips = [get_private_ip(worker_id) for worker_id in worker_instance_ids]
-    proxy_instance_id = setup_proxy(ec2_client, key_pair_name, private_sg_id, subnet_id, manager_ip, worker_ips)
+    ready_after = wait_for_cluster_ready(cluster['gatekeeper_ip'], cluster['launch_time'])
+    print_readiness(ready_after)
+    benchmark_cluster(cluster['gatekeeper_ip'])
 
-    proxy_ip = get_private_ip(proxy_instance_id)
-    gatekeeper_instance_id, trusted_host_id = setup_gatekeeper(ec2_client, key_pair_name, public_sg_id, private_sg_id, subnet_id, proxy_ip)
+def bake():
+    key_pair_name = retrieve_key_pair(ec2_client)
+
+    vpc_id = retrieve_vpc_id(ec2_client)
+    subnet_id = retrieve_subnet_id(ec2_client, vpc_id)
 
-    time.sleep(120)
-    gatekeeper_ip = get_public_ip(gatekeeper_instance_id)
-    benchmark_cluster(gatekeeper_ip)
+    public_sg_id = create_public_security_group(ec2_client, vpc_id)
+    private_sg_id = create_private_security_group(ec2_client, vpc_id, public_sg_id)
+
+    bake_images(ec2_client, key_pair_name, private_sg_id, subnet_id)
 
 if __name__ == "__main__":
-    main()
+    # "python main_script.py bake" builds the node images, used by every later deployment
+    if sys.argv[1:] == ['bake']:
+        bake()
+    else:
+        main()
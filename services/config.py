@@ -0,0 +1,37 @@
+import json
+import os
+
+# Settings of a service come from the environment, else from the JSON file named by
+# CLUSTER_CONFIG (written next to the services by the launch functions), else from
+# their default. Values are converted to the type of the default.
+CONFIG_FILE = os.environ.get("CLUSTER_CONFIG", "cluster_config.json")
+
+
+def load_config_file(path=CONFIG_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+file_config = load_config_file()
+
+
+def setting(name, default):
+    """
+    Read a setting.
+    Args:
+        name: Name of the environment variable and config file entry.
+        default: Value used when neither has it; its type is the type of the setting.
+    Returns:
+        The value of the setting.
+    """
+    if name in os.environ:
+        value = os.environ[name]
+    else:
+        value = file_config.get(name, default)
+    if value is None or default is None or isinstance(value, type(default)):
+        return value
+    if isinstance(default, (list, dict)):
+        return json.loads(value)
+    return type(default)(value)
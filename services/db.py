@@ -0,0 +1,166 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import mysql.connector
+
+from services.config import setting
+from services.metrics import Histogram
+from services.tracing import traced
+
+# Time spent waiting for a pooled connection, and spent in MySQL by each query function
+DB_POOL_WAIT_SECONDS = Histogram("db_pool_wait_duration_seconds", "Time to get a MySQL connection from the pool.")
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Time spent running queries on MySQL, by query.", ("query",))
+
+STATEMENT_CACHE_SIZE = 32  # Prepared statements kept open per connection, least recently used closed first
+
+
+# MySQL connection pool of the manager and worker services, per uvicorn process.
+# Queries run in the threadpool so they never block the event loop.
+class ConnectionPool:
+    def __init__(self, size, max_overflow, recycle, **connect_args):
+        self.size = size
+        self.recycle = recycle
+        self.connect_args = connect_args
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size + max_overflow)
+        self.lock = threading.Lock()
+        self.statements = {}  # Prepared cursors of each connection, by query
+        self.stats = {"created": 0, "recycled": 0, "discarded": 0, "in_use": 0, "waits": 0, "prepared": 0}
+
+    def _count(self, key, delta=1):
+        with self.lock:
+            self.stats[key] += delta
+
+    def acquire(self, timeout=30):
+        with DB_POOL_WAIT_SECONDS.time():
+            return self._acquire(timeout)
+
+    def _acquire(self, timeout):
+        if not self.slots.acquire(blocking=False):
+            self._count("waits")
+            if not self.slots.acquire(timeout=timeout):
+                raise TimeoutError("No MySQL connection available")
+        try:
+            while True:
+                try:
+                    conn, created_at = self.idle.get_nowait()
+                except queue.Empty:
+                    conn, created_at = mysql.connector.connect(**self.connect_args), time.monotonic()
+                    self._count("created")
+                    break
+                if time.monotonic() - created_at < self.recycle:
+                    break
+                self._count("recycled")
+                self._close(conn)
+        except Exception:
+            self.slots.release()
+            raise
+        self._count("in_use")
+        return conn, created_at
+
+    def release(self, entry, discard=False):
+        conn, created_at = entry
+        if discard or self.idle.qsize() >= self.size:
+            self._count("discarded")
+            try:
+                self._close(conn)
+            except mysql.connector.Error:
+                pass
+        else:
+            self.idle.put(entry)
+        self._count("in_use", -1)
+        self.slots.release()
+
+    def _close(self, conn):
+        # Closing the connection also deallocates its statements on the server
+        self.statements.pop(conn, None)
+        conn.close()
+
+    def execute_prepared(self, conn, query, params=(), dictionary=False):
+        """
+        Run a query as a server-side prepared statement of the connection, in the binary
+        protocol. The statement is prepared on its first use on the connection and reused
+        afterwards, so MySQL parses the query once per connection instead of on every call.
+        Args:
+            conn: Connection of connection().
+            query: SQL with %s placeholders.
+            params: Sequence of parameter values.
+            dictionary: Return rows as dicts.
+        Returns:
+            The cursor, whose rows must all be fetched before the connection runs another query.
+        """
+        statements = self.statements.setdefault(conn, OrderedDict())
+        key = (query, dictionary)
+        entry = statements.get(key)
+        if entry is None:
+            if len(statements) >= STATEMENT_CACHE_SIZE:
+                statements.popitem(last=False)[1][0].close()
+            entry = statements[key] = (conn.cursor(prepared=True, dictionary=dictionary), query)
+            self._count("prepared")
+        else:
+            statements.move_to_end(key)
+        cursor, prepared_query = entry
+        # The cursor prepares the query again unless it gets the very string object it prepared
+        cursor.execute(prepared_query, params)
+        return cursor
+
+    @contextmanager
+    def connection(self):
+        entry = self.acquire()
+        try:
+            yield entry[0]
+        except mysql.connector.Error:
+            self.release(entry, discard=True)
+            raise
+        except BaseException:
+            entry[0].rollback()
+            self.release(entry)
+            raise
+        else:
+            self.release(entry)
+
+    def ping(self):
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def report(self):
+        return {"size": self.size, "idle": self.idle.qsize(), **self.stats}
+
+
+@contextmanager
+def timed_query(name):
+    # Time spent in MySQL by a query function, as metric and as span of the request trace
+    with DB_QUERY_SECONDS.time(name), traced(f"mysql {name}", "client", query=name):
+        yield
+
+
+def open_pool():
+    """
+    Create the connection pool of this process from the DB_* settings.
+    Returns:
+        ConnectionPool instance.
+    """
+    return ConnectionPool(
+        setting("DB_POOL_SIZE", 10),
+        setting("DB_POOL_MAX_OVERFLOW", 10),
+        setting("DB_POOL_RECYCLE", 3600.0),
+        host=setting("DB_HOST", "localhost"),
+        user=setting("DB_USER", "api_user"),
+        password=setting("DB_PASSWORD", "api_password"),
+        database=setting("DB_NAME", "sakila"),
+        # Every statement commits on its own. Otherwise a pooled connection keeps the
+        # REPEATABLE READ snapshot of its first SELECT until it is recycled, and never
+        # sees the rows replicated after it
+        autocommit=True,
+        use_pure=False,  # C extension when it is installed
+    )
@@ -0,0 +1,147 @@
+import logging
+import time
+
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from services.metrics import UPSTREAM_IN_FLIGHT, UPSTREAM_REQUESTS, UPSTREAM_SECONDS
+from services.tracing import new_span
+
+logger = logging.getLogger(__name__)
+
+# httpx logs every request at INFO, keep it out of the request path
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Headers that only concern one connection and are never relayed (RFC 9110, section 7.6.1)
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+                      "transfer-encoding", "upgrade", "host"}
+# Response headers uvicorn adds itself on every node
+SERVER_HEADERS = {"date", "server"}
+# Trace context of the caller, replaced by the one of the upstream call
+TRACE_HEADERS = {"traceparent", "tracestate"}
+
+# Bodies up to this size are relayed in one piece, larger or unsized ones are streamed
+RELAY_BUFFER_LIMIT = 65536  # Bytes
+# Idle keep-alive connections are dropped before uvicorn's 5 second timeout closes them on
+# the other side, which would fail the request that happens to reuse one at that moment
+KEEPALIVE_EXPIRY = 4  # Seconds
+
+
+def relayed_headers(headers, dropped=HOP_BY_HOP_HEADERS):
+    return [(name, value) for name, value in headers if name.lower() not in dropped]
+
+
+def upstream_name(url):
+    # host:port of an http:// URL, the label of the upstream metrics
+    return url.split("/", 3)[2]
+
+
+# Keep-alive client of the Gatekeeper, Trusted Host and Proxy services towards their next
+# hop. The app lifespan calls open() and close().
+class ForwardingClient:
+    def __init__(self, pool_size, timeout, health_timeout):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.health_timeout = health_timeout
+        self.client = None
+        self.stats = {"requests": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0}
+
+    async def open(self):
+        limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size,
+                              keepalive_expiry=KEEPALIVE_EXPIRY)
+        self.client = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(self.timeout))
+
+    async def close(self):
+        await self.client.aclose()
+
+    def _start(self, method, url):
+        # Client span of the upstream call, its traceparent goes with the request
+        upstream = upstream_name(url)
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+        UPSTREAM_IN_FLIGHT.inc(upstream)
+        return new_span(f"{method} {upstream}", "client", upstream=upstream, path="/" + url.split("/", 3)[3])
+
+    def _end(self, span, status):
+        upstream = span.attributes["upstream"]
+        self.stats["in_flight"] -= 1
+        UPSTREAM_IN_FLIGHT.dec(upstream)
+        UPSTREAM_SECONDS.observe(time.perf_counter() - span.started, upstream)
+        UPSTREAM_REQUESTS.inc(upstream, status)
+        span.attributes["status_code"] = status
+        if status == "error":
+            self.stats["errors"] += 1
+            span.end("error")
+        else:
+            span.end("error" if status >= 500 else "ok")
+
+    async def forward(self, method, url, headers=None, **kwargs):
+        span = self._start(method, url)
+        headers = {**(headers or {}), "traceparent": span.traceparent()}
+        status = "error"
+        try:
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+            status = response.status_code
+            return response
+        except httpx.HTTPError as e:
+            logger.error(f"Forwarding to {url} failed: {e!r}")
+            raise HTTPException(status_code=502, detail="Upstream request failed")
+        finally:
+            self._end(span, status)
+
+    async def relay(self, request, url):
+        # Sends the request to url and its response back as raw bytes: bodies are never
+        # parsed and every end-to-end header, including the status, passes through unchanged.
+        # Small bodies are read whole, which costs less than streaming them chunk by chunk.
+        if request.url.query:
+            url = f"{url}?{request.url.query}"
+        if "transfer-encoding" in request.headers or int(request.headers.get("content-length", 0)) > RELAY_BUFFER_LIMIT:
+            content = request.stream()
+        elif "content-length" in request.headers:
+            content = await request.body()
+        else:
+            content = None
+        span = self._start(request.method, url)
+        headers = relayed_headers(request.headers.items(), HOP_BY_HOP_HEADERS | TRACE_HEADERS)
+        upstream_request = self.client.build_request(
+            request.method, url, headers=headers + [("traceparent", span.traceparent())], content=content,
+        )
+        try:
+            response = await self.client.send(upstream_request, stream=True)
+        except httpx.HTTPError as e:
+            self._end(span, "error")
+            logger.error(f"Relaying to {url} failed: {e!r}")
+            raise HTTPException(status_code=502, detail="Upstream request failed")
+        headers = dict(relayed_headers(response.headers.multi_items(), HOP_BY_HOP_HEADERS | SERVER_HEADERS))
+        if int(response.headers.get("content-length", RELAY_BUFFER_LIMIT + 1)) <= RELAY_BUFFER_LIMIT:
+            status = "error"
+            try:
+                # Raw bytes, so a compressed body stays as the upstream encoded it
+                body = b"".join([chunk async for chunk in response.aiter_raw()])
+                status = response.status_code
+            except httpx.HTTPError as e:
+                logger.error(f"Relaying to {url} failed: {e!r}")
+                raise HTTPException(status_code=502, detail="Upstream request failed")
+            finally:
+                await self._finish_relay(response, span, status)
+            return Response(body, status_code=response.status_code, headers=headers)
+        return StreamingResponse(response.aiter_raw(), status_code=response.status_code, headers=headers,
+                                 background=BackgroundTask(self._finish_relay, response, span, response.status_code))
+
+    async def _finish_relay(self, response, span, status):
+        await response.aclose()
+        self._end(span, status)
+
+    async def check_upstream(self, url):
+        # The next hop answers 503 with its report when it is not healthy
+        try:
+            response = await self.client.get(url, timeout=self.health_timeout)
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            return {"ready": False, "healthy": False, "error": repr(e)}
+
+    def report(self):
+        return {"max_connections": self.pool_size, "timeout": self.timeout, **self.stats}
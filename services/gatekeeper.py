@@ -0,0 +1,125 @@
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
+
+from services.config import setting
+from services.forwarding import ForwardingClient
+from services.health import health_response
+from services.logs import setup_service_logging
+from services.metrics import instrument
+from services.models import Item, ItemBatch, ItemIds
+from services.tracing import trace_requests
+
+# JSON records written by a background thread, request records sampled per route
+setup_service_logging()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await upstream.open()
+    yield
+    await upstream.close()
+
+
+app = FastAPI(lifespan=lifespan)
+instrument(app)
+# Clients must not decide what is traced
+trace_requests(app, "gatekeeper", trust_incoming=False)
+
+trusted_host_url = f"http://{setting('TRUSTED_HOST_IP', 'localhost')}:8000"
+max_write_batch = setting("MAX_WRITE_BATCH", 1000)
+max_search_results = setting("MAX_SEARCH_RESULTS", 1000)
+max_read_many = setting("MAX_READ_MANY", 1000)
+read_strategies = ("random", "direct", "ping", "lor", "p2c", "wrr")
+
+# Connection pool used to forward requests to the trusted host
+pool_size = setting("FORWARD_POOL_SIZE", 100)
+pool_timeout = setting("FORWARD_TIMEOUT", 10.0)
+health_timeout = setting("HEALTH_TIMEOUT", 6.0)
+upstream = ForwardingClient(pool_size, pool_timeout, health_timeout)
+
+
+@app.get("/pool-stats")
+def get_pool_stats():
+    return upstream.report()
+
+
+# Requests are validated here, at the edge, then relayed to the trusted host as they came
+# and its responses back without parsing
+async def relay(request):
+    return await upstream.relay(request, f"{trusted_host_url}{request.url.path}")
+
+
+@app.post("/write")
+async def write(item: Item, request: Request):
+    logger.info("Received write request", extra={"route": "/write", "item": item.dict()})
+    return await relay(request)
+
+
+@app.post("/write_batch")
+async def write_batch(batch: ItemBatch, request: Request):
+    if not 1 <= len(batch.items) <= max_write_batch:
+        raise HTTPException(status_code=400, detail=f"A batch holds 1 to {max_write_batch} items")
+    return await relay(request)
+
+
+@app.get("/random-read/")
+async def random_read(item_id: int, request: Request, gtid: str = None):
+    return await relay(request)
+
+
+@app.get("/direct-read/")
+async def direct_read(item_id: int, request: Request, gtid: str = None):
+    return await relay(request)
+
+
+@app.get("/ping-read/")
+async def ping_read(item_id: int, request: Request, gtid: str = None):
+    return await relay(request)
+
+
+@app.get("/lor-read/")
+async def lor_read(item_id: int, request: Request, gtid: str = None):
+    return await relay(request)
+
+
+@app.get("/p2c-read/")
+async def p2c_read(item_id: int, request: Request, gtid: str = None):
+    return await relay(request)
+
+
+@app.get("/wrr-read/")
+async def wrr_read(item_id: int, request: Request, gtid: str = None):
+    return await relay(request)
+
+
+@app.get("/read/")
+async def read(item_id: int, request: Request, strategy: str = "random", gtid: str = None):
+    if strategy not in read_strategies:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy {strategy}")
+    return await relay(request)
+
+
+@app.get("/search/")
+async def search(last_name: str, request: Request, limit: int = 100, strategy: str = "random"):
+    if strategy not in read_strategies:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy {strategy}")
+    if not 1 <= limit <= max_search_results:
+        raise HTTPException(status_code=400, detail=f"The limit must be between 1 and {max_search_results}")
+    return await relay(request)
+
+
+@app.post("/read_many")
+async def read_many(batch: ItemIds, request: Request, strategy: str = "random"):
+    if strategy not in read_strategies:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy {strategy}")
+    if not 1 <= len(batch.item_ids) <= max_read_many:
+        raise HTTPException(status_code=400, detail=f"A request reads 1 to {max_read_many} item_ids")
+    return await relay(request)
+
+
+@app.get("/health")
+async def health():
+    return health_response({}, {"trusted_host": await upstream.check_upstream(f"{trusted_host_url}/health")})
@@ -0,0 +1,21 @@
+import time
+
+from fastapi.responses import JSONResponse
+
+# "ready" covers the checks of this node and "healthy" also requires every upstream node
+# to be healthy; "ready_since" is the epoch at which the node became ready, its start
+# time if it was ready the first time it was asked.
+health_state = {"started_at": time.time(), "ready_since": None, "failed": False}
+
+
+def health_response(checks, upstream=None):
+    upstream = upstream or {}
+    ready = all(checks.values())
+    if not ready:
+        health_state["failed"] = True
+    elif health_state["ready_since"] is None:
+        health_state["ready_since"] = time.time() if health_state["failed"] else health_state["started_at"]
+    healthy = ready and all(report.get("healthy", False) for report in upstream.values())
+    body = {"ready": ready, "healthy": healthy, "ready_since": health_state["ready_since"],
+            "checks": checks, "upstream": upstream}
+    return JSONResponse(body, status_code=200 if healthy else 503)
@@ -0,0 +1,105 @@
+import atexit
+import json
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+from services.config import setting
+from services.tracing import current_span
+
+# Attributes every LogRecord has, the others come from the extra argument of the logging call
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format a record as one JSON object per line, with the fields given as extra.
+    The time keeps the "YYYY-MM-DD HH:MM:SS,mmm" layout of the text logs.
+    """
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES:
+                entry[name] = value
+        return json.dumps(entry, default=str)
+
+
+class LogSampler(logging.Filter):
+    """
+    Keep a fraction of the records of each route, in the caller's thread so that dropped
+    records are never formatted. Records without a route, warnings and errors, and the
+    records of a traced request are always kept. A kept sampled record carries its rate,
+    so counts can be scaled back.
+    """
+    def __init__(self, default_rate=1.0, rates=None, key="route"):
+        super().__init__()
+        self.default_rate = default_rate
+        self.rates = rates or {}
+        self.key = key
+
+    def filter(self, record):
+        span = current_span.get()
+        if span is not None and span.sampled:
+            record.trace_id = span.trace_id
+            return True
+        route = getattr(record, self.key, None)
+        if route is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(route, self.default_rate)
+        if rate >= 1:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class LogListener(QueueListener):
+    def stop(self):
+        # Also called at exit, after the owner may have stopped it already
+        if self._thread is not None:
+            super().stop()
+
+
+def start_queue_logging(handlers, default_rate=1.0, rates=None, key="route", level=logging.INFO):
+    """
+    Send the records of the root logger through a queue to handlers run by a background
+    thread, so logging never waits on I/O.
+    Args:
+        handlers: Handlers writing the records, formatted as JSON lines.
+        default_rate: Fraction of the records of a route kept.
+        rates: Dict mapping route to the fraction of its records kept, overriding default_rate.
+        key: Extra field of the records holding their route.
+        level: Level of the root logger.
+    Returns:
+        The started LogListener, its stop() writes the pending records.
+    """
+    records = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    queue_handler.addFilter(LogSampler(default_rate, rates, key))
+    for handler in handlers:
+        handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+    listener = LogListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def setup_service_logging():
+    """
+    Log the records of a service as JSON lines to the standard error, sampled per route
+    with the LOG_SAMPLE_RATE and LOG_SAMPLE_RATES settings.
+    Returns:
+        The started LogListener.
+    """
+    return start_queue_logging([logging.StreamHandler()], setting("LOG_SAMPLE_RATE", 0.01),
+                               setting("LOG_SAMPLE_RATES", {}))
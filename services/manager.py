@@ -0,0 +1,153 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from services.config import setting
+from services.db import open_pool, timed_query
+from services.health import health_response
+from services.metrics import instrument
+from services.models import Item, ItemBatch
+from services.tracing import trace_requests
+
+# Same as auto_increment_increment in the MySQL configuration, the number of shards
+id_step = setting("AUTO_INCREMENT_INCREMENT", 1)
+
+# Group commit: when enabled, concurrent single inserts are queued for up to
+# group_commit_window ms and written with one multi-row INSERT and one commit
+group_commit_window = setting("GROUP_COMMIT_WINDOW", 0.0)
+group_commit_max_batch = setting("GROUP_COMMIT_MAX_BATCH", 100)
+
+# Same limit as the Gatekeeper's, the Proxy and the Trusted Host can also reach the manager.
+# A prepared statement takes at most 65535 parameters, two per item
+max_write_batch = setting("MAX_WRITE_BATCH", 1000)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    flusher = asyncio.create_task(flush_group_commits()) if group_commit_window > 0 else None
+    yield
+    if flusher:
+        flusher.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+instrument(app)
+trace_requests(app, "manager")
+
+db_pool = open_pool()
+
+
+def insert_rows(items):
+    # One multi-row INSERT and one commit for the whole batch. With InnoDB, the rows
+    # of a single simple INSERT receive consecutive ids (id_step apart) starting at lastrowid.
+    # Both statements are prepared once per connection, the INSERT once per batch size
+    with db_pool.connection() as conn, timed_query("insert_rows"):
+        query = "INSERT INTO actor (first_name, last_name) VALUES " + ", ".join(["(%s, %s)"] * len(items))
+        cursor = db_pool.execute_prepared(conn, query, [value for item in items for value in (item.column1, item.column2)])
+        first_id = cursor.lastrowid
+        conn.commit()
+        # Executed GTID set once the insert is committed, replicas that have applied
+        # it are guaranteed to return the new rows
+        gtid_executed = db_pool.execute_prepared(conn, "SELECT @@GLOBAL.gtid_executed").fetchall()[0][0]
+    return [first_id + offset * id_step for offset in range(len(items))], "".join(gtid_executed.split())
+
+
+pending_inserts = asyncio.Queue()
+group_commit_stats = {"batches": 0, "items": 0, "retried_batches": 0}
+
+
+async def flush_group_commits():
+    while True:
+        batch = [await pending_inserts.get()]
+        deadline = time.monotonic() + group_commit_window / 1000
+        while len(batch) < group_commit_max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(pending_inserts.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        try:
+            item_ids, gtid = await run_in_threadpool(insert_rows, [item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                fail_waiter(batch[0][1], e)
+                continue
+            # The INSERT of the whole group is rolled back by one bad row: insert the items one
+            # by one so that only the caller of that row gets the error
+            group_commit_stats["retried_batches"] += 1
+            for item, waiter in batch:
+                try:
+                    item_ids, gtid = await run_in_threadpool(insert_rows, [item])
+                except Exception as error:
+                    fail_waiter(waiter, error)
+                    continue
+                if not waiter.done():
+                    waiter.set_result((item_ids[0], gtid))
+            continue
+        group_commit_stats["batches"] += 1
+        group_commit_stats["items"] += len(batch)
+        for item_id, (_, waiter) in zip(item_ids, batch):
+            if not waiter.done():
+                waiter.set_result((item_id, gtid))
+
+
+def fail_waiter(waiter, error):
+    if not waiter.done():
+        waiter.set_exception(error)
+
+
+@app.get("/pool-stats")
+def get_pool_stats():
+    return db_pool.report()
+
+
+@app.get("/health")
+async def health():
+    return health_response({"database": await run_in_threadpool(db_pool.ping)})
+
+
+def read_gtid_executed():
+    with db_pool.connection() as conn, timed_query("read_gtid_executed"):
+        cursor = conn.cursor()
+        cursor.execute("SELECT @@GLOBAL.gtid_executed")
+        gtid_executed = cursor.fetchone()[0]
+        cursor.close()
+    return "".join(gtid_executed.split())
+
+
+@app.get("/gtid-executed/")
+async def gtid_executed():
+    return {"gtid_executed": await run_in_threadpool(read_gtid_executed)}
+
+
+@app.get("/group-commit-stats")
+def get_group_commit_stats():
+    return {"window_ms": group_commit_window, "max_batch": group_commit_max_batch,
+            "queued": pending_inserts.qsize(), **group_commit_stats}
+
+
+@app.post("/insert_item/")
+async def insert_item(item: Item):
+    if group_commit_window > 0:
+        waiter = asyncio.get_running_loop().create_future()
+        await pending_inserts.put((item, waiter))
+        item_id, gtid = await waiter
+    else:
+        item_ids, gtid = await run_in_threadpool(insert_rows, [item])
+        item_id = item_ids[0]
+    return {"message": "Item inserted successfully", "item_id": item_id, "gtid": gtid}
+
+
+@app.post("/insert_items/")
+async def insert_items(batch: ItemBatch):
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if len(batch.items) > max_write_batch:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {max_write_batch} items")
+    item_ids, gtid = await run_in_threadpool(insert_rows, batch.items)
+    return {"message": f"{len(item_ids)} items inserted successfully", "item_ids": item_ids, "gtid": gtid}
@@ -0,0 +1,168 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from fastapi.responses import PlainTextResponse
+
+# Metrics of a service in the Prometheus text format, served on /metrics. Updating one is
+# a dict lookup and an addition under an uncontended lock (the DB metrics are updated from
+# the threadpool) so it can sit on the request path; buckets are cumulated only when
+# /metrics is scraped.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Seconds
+
+registry = []
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        for values, value in items:
+            yield self.name, format_labels(self.labels, values), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {value}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # Per label values: the count of each bucket (the last one is +Inf) and the sum
+        bucket = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bucket] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(values, (list(counts), total)) for values, (counts, total) in sorted(self.values.items())]
+        for values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", format_labels(self.labels + ("le",), values + (bound,)), cumulative
+            yield f"{self.name}_sum", format_labels(self.labels, values), total
+            yield f"{self.name}_count", format_labels(self.labels, values), cumulative
+
+
+def render_metrics():
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+REQUESTS = Counter("http_requests_total", "Requests handled, by route, method and status.",
+                   ("route", "method", "status"))
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled.")
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time to handle a request, by route and method.",
+                            ("route", "method"))
+UPSTREAM_REQUESTS = Counter("upstream_requests_total", "Requests sent to the next hop, by upstream and status.",
+                            ("upstream", "status"))
+UPSTREAM_IN_FLIGHT = Gauge("upstream_requests_in_flight", "Requests waiting for the next hop, by upstream.",
+                           ("upstream",))
+UPSTREAM_SECONDS = Histogram("upstream_request_duration_seconds",
+                             "Time until the next hop answered, by upstream.", ("upstream",))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting and timing every HTTP request by route template, so paths
+    with parameters and unknown paths do not create a label value each.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The router sets the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route, scope["method"])
+            REQUESTS.inc(route, scope["method"], status[0])
+
+
+def instrument(app):
+    """
+    Add the request metrics and the /metrics endpoint to a service.
+    Args:
+        app: FastAPI application of the service.
+    """
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,19 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+# Length of the first_name and last_name columns of the actor table, VARCHAR(45)
+MAX_NAME_LENGTH = 45
+
+
+class Item(BaseModel):
+    column1: str = Field(..., max_length=MAX_NAME_LENGTH)
+    column2: str = Field(..., max_length=MAX_NAME_LENGTH)
+
+
+class ItemBatch(BaseModel):
+    items: List[Item]
+
+
+class ItemIds(BaseModel):
+    item_ids: List[int]
@@ -0,0 +1,806 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import zlib
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import List
+
+import httpx
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from services.config import setting
+from services.forwarding import ForwardingClient
+from services.health import health_response
+from services.logs import setup_service_logging
+from services.metrics import instrument
+from services.models import Item, ItemBatch, ItemIds
+from services.tracing import trace_requests
+
+# JSON records written by a background thread, request records sampled per route
+setup_service_logging()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await upstream.open()
+    prober = asyncio.create_task(probe_workers())
+    replication_tracker = asyncio.create_task(track_replication())
+    yield
+    prober.cancel()
+    replication_tracker.cancel()
+    await upstream.close()
+
+
+app = FastAPI(lifespan=lifespan)
+instrument(app)
+trace_requests(app, "proxy")
+
+# Manager of each shard and shard of each worker, from the shard map. A write goes to
+# the shard of the hash of its name, a read to the shard of its item_id: the manager of
+# shard k only allocates ids equal to k + 1 modulo the number of shards.
+shard_map_file = setting("SHARD_MAP_FILE", "shard_map.json")
+with open(shard_map_file) as file:
+    shard_map = json.load(file)
+shard_managers = [shard["manager"] for shard in shard_map["shards"]]
+worker_shard = {worker_ip: index for index, shard in enumerate(shard_map["shards"]) for worker_ip in shard["workers"]}
+
+
+def write_shard(item):
+    return zlib.crc32(f"{item.column1} {item.column2}".encode()) % len(shard_managers)
+
+
+def item_shard(item_id):
+    return (item_id - 1) % len(shard_managers)
+
+
+# Registered workers and their state: "joining" until their replication has caught up
+# with their manager, "active" while they can serve reads, "draining" until their in-flight
+# reads are done. Workers given at deployment start active, others register at runtime.
+worker_ips = list(worker_shard)
+worker_state = {worker_ip: "active" for worker_ip in worker_ips}
+drain_timeout = setting("DRAIN_TIMEOUT", 30.0)
+
+# Connection pool used to forward requests to the manager and workers
+pool_size = setting("FORWARD_POOL_SIZE", 100)
+pool_timeout = setting("FORWARD_TIMEOUT", 10.0)
+health_timeout = setting("HEALTH_TIMEOUT", 2.0)
+upstream = ForwardingClient(pool_size, pool_timeout, health_timeout)
+
+
+@app.get("/pool-stats")
+def get_pool_stats():
+    return upstream.report()
+
+
+# Requests in flight to each worker, used by the load-aware strategies, and reads
+# and latency of the most recent reads of each worker, reported by /worker-stats
+outstanding = {worker_ip: 0 for worker_ip in worker_ips}
+latency_window = setting("LATENCY_WINDOW", 1000)
+worker_reads = {worker_ip: 0 for worker_ip in worker_ips}
+worker_read_errors = {worker_ip: 0 for worker_ip in worker_ips}
+worker_read_latency = {worker_ip: deque(maxlen=latency_window) for worker_ip in worker_ips}
+
+
+async def request_worker(worker_ip, path, params=None, body=None):
+    # A GET with the query params, or a POST of the JSON body when there is one
+    outstanding[worker_ip] += 1
+    started = time.perf_counter()
+    response = None
+    try:
+        response = await upstream.forward("GET" if body is None else "POST", f"http://{worker_ip}:8000{path}",
+                                          params=params, json=body)
+    finally:
+        # The worker may have been removed after its drain timeout
+        if worker_ip in outstanding:
+            outstanding[worker_ip] -= 1
+            worker_reads[worker_ip] += 1
+            if response is not None and response.status_code == 200:
+                worker_read_latency[worker_ip].append(time.perf_counter() - started)
+            else:
+                worker_read_errors[worker_ip] += 1
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    return response.json()
+
+
+async def read_from_worker(worker_ip, item_id, wait_gtid=None):
+    params = {"item_id": item_id}
+    if wait_gtid:
+        params["wait_gtid"] = wait_gtid
+        params["wait_timeout"] = ryw_timeout
+    return await request_worker(worker_ip, "/get_item/", params)
+
+
+# LRU read-through cache of worker responses keyed by item_id. Inserts only add rows,
+# so found items never change. Missing items are not cached: the id may be written any
+# moment, or be written already and not replicated yet to the worker that answered.
+cache_size = setting("CACHE_SIZE", 10000)
+cache_ttl = setting("CACHE_TTL", 30.0)
+item_cache = OrderedDict()
+MISSING_ITEM = {"status": 200, "message": "Error"}  # What /get_item/ answers for an unknown id
+# Time of the last invalidation of recently written items. A read started before it may
+# have seen the item as it was before the write, so its result is not cached.
+recent_invalidations = OrderedDict()
+cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+
+def cache_get(item_id):
+    entry = item_cache.get(item_id)
+    if entry is None:
+        cache_stats["misses"] += 1
+        return None
+    expires_at, result = entry
+    if expires_at < time.monotonic():
+        del item_cache[item_id]
+        cache_stats["expirations"] += 1
+        cache_stats["misses"] += 1
+        return None
+    item_cache.move_to_end(item_id)
+    cache_stats["hits"] += 1
+    return result
+
+
+def cache_put(item_id, result, read_started):
+    """
+    Args:
+        item_id: Item read.
+        result: Response of the worker.
+        read_started: time.monotonic() when the read was sent.
+    """
+    if result == MISSING_ITEM or recent_invalidations.get(item_id, read_started - 1) >= read_started:
+        return
+    item_cache[item_id] = (time.monotonic() + cache_ttl, result)
+    item_cache.move_to_end(item_id)
+    while len(item_cache) > cache_size:
+        item_cache.popitem(last=False)
+        cache_stats["evictions"] += 1
+
+
+def cache_invalidate(item_id):
+    now = time.monotonic()
+    recent_invalidations[item_id] = now
+    recent_invalidations.move_to_end(item_id)
+    # Reads last at most FORWARD_TIMEOUT, older invalidations cannot overlap one
+    while next(iter(recent_invalidations.values())) < now - pool_timeout:
+        recent_invalidations.popitem(last=False)
+    if item_cache.pop(item_id, None) is not None:
+        cache_stats["invalidations"] += 1
+
+
+@app.get("/cache-stats")
+def get_cache_stats():
+    lookups = cache_stats["hits"] + cache_stats["misses"]
+    return {
+        "size": len(item_cache),
+        "capacity": cache_size,
+        "ttl": cache_ttl,
+        "hit_ratio": cache_stats["hits"] / lookups if lookups else 0,
+        **cache_stats,
+    }
+
+
+# Source UUID of the GTIDs returned by the manager of each shard. A read-your-writes
+# read only waits for the part of a GTID set the replicas of its shard can apply.
+gtid_shard = {}
+
+
+def learn_gtid_sources(gtid, shard):
+    for source_uuid in parse_gtid_set(gtid or ""):
+        gtid_shard[source_uuid] = shard
+
+
+@app.post("/write")
+async def write(item: Item):
+    logger.info("Received write request", extra={"route": "/write", "item": item.dict()})
+    shard = write_shard(item)
+    response = await upstream.forward("POST", f"http://{shard_managers[shard]}:8000/insert_item/", json=item.dict())
+    if response.status_code != 200:
+        # Passed on as is, the body of an error may not be JSON
+        logger.warning("Write request failed", extra={"route": "/write", "shard": shard, "status": response.status_code})
+        return Response(response.content, status_code=response.status_code,
+                        media_type=response.headers.get("content-type"))
+    result = response.json()
+    logger.info("Forwarded write request", extra={"route": "/write", "shard": shard, "result": result})
+    if "item_id" in result:
+        cache_invalidate(result["item_id"])
+        learn_gtid_sources(result.get("gtid"), shard)
+    return result
+
+
+@app.post("/write_batch")
+async def write_batch(batch: ItemBatch):
+    logger.info("Received write batch", extra={"route": "/write_batch", "items": len(batch.items)})
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    # The items of each shard are inserted by its manager, all shards concurrently. Each
+    # part commits on its own: when one fails, the parts of the other shards are stored,
+    # so every response is handled and the caller gets the ids of the stored items.
+    positions = {}
+    for position, item in enumerate(batch.items):
+        positions.setdefault(write_shard(item), []).append(position)
+    responses = await asyncio.gather(*(
+        upstream.forward("POST", f"http://{shard_managers[shard]}:8000/insert_items/",
+                json={"items": [batch.items[position].dict() for position in shard_positions]})
+        for shard, shard_positions in positions.items()
+    ), return_exceptions=True)
+    item_ids = [None] * len(batch.items)
+    gtids = []
+    errors = []
+    for (shard, shard_positions), response in zip(positions.items(), responses):
+        if isinstance(response, HTTPException):
+            errors.append({"shard": shard, "status": response.status_code, "detail": response.detail})
+            continue
+        if isinstance(response, BaseException):
+            raise response
+        if response.status_code != 200:
+            errors.append({"shard": shard, "status": response.status_code, "detail": response.text})
+            continue
+        result = response.json()
+        for position, item_id in zip(shard_positions, result["item_ids"]):
+            item_ids[position] = item_id
+            cache_invalidate(item_id)
+        learn_gtid_sources(result["gtid"], shard)
+        gtids.append(result["gtid"])
+    gtid = ",".join(gtid for gtid in gtids if gtid)
+    if not errors:
+        return {"message": f"{len(item_ids)} items inserted successfully", "item_ids": item_ids, "gtid": gtid}
+    # Failed positions keep None. 207 when part of the batch is stored, else the status of a failed shard
+    inserted = sum(item_id is not None for item_id in item_ids)
+    logger.warning("Write batch partly failed", extra={"route": "/write_batch", "errors": errors})
+    return JSONResponse({"message": f"{inserted} of {len(item_ids)} items inserted", "item_ids": item_ids,
+                         "gtid": gtid, "errors": errors}, status_code=207 if inserted else errors[0]["status"])
+
+
+# Smoothed (EWMA) TCP connect time of each worker in ms, None while unreachable,
+# refreshed in the background so /ping-read/ only reads fastest_worker.
+# Weighted round-robin gives each worker a weight inversely proportional to it.
+probe_interval = setting("PROBE_INTERVAL", 1.0)
+probe_alpha = setting("PROBE_ALPHA", 0.3)
+worker_latency = {worker_ip: None for worker_ip in worker_ips}
+worker_weight = {worker_ip: 1.0 for worker_ip in worker_ips}
+fastest_worker = worker_ips[0] if worker_ips else None
+
+
+async def probe_worker(worker_ip):
+    # A worker not answering within a probe interval counts as down, so that it does not
+    # hold back the samples of the others, which are gathered with it
+    started = time.perf_counter()
+    timeout = min(health_timeout, probe_interval)
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(worker_ip, 8000), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    elapsed = (time.perf_counter() - started) * 1000
+    writer.close()
+    await writer.wait_closed()
+    return elapsed
+
+
+async def probe_workers():
+    global fastest_worker
+    while True:
+        # Workers can be registered or removed while the probes are running
+        probed = list(worker_ips)
+        samples = await asyncio.gather(*(probe_worker(worker_ip) for worker_ip in probed))
+        for worker_ip, sample in zip(probed, samples):
+            if worker_ip not in worker_latency:
+                continue
+            previous = worker_latency[worker_ip]
+            if sample is None or previous is None:
+                worker_latency[worker_ip] = sample
+            else:
+                worker_latency[worker_ip] = probe_alpha * sample + (1 - probe_alpha) * previous
+        reachable = [worker_ip for worker_ip in worker_ips if worker_latency[worker_ip] is not None]
+        if reachable:
+            fastest_worker = min(reachable, key=worker_latency.get)
+            for worker_ip in worker_ips:
+                latency = worker_latency[worker_ip]
+                worker_weight[worker_ip] = 1 / max(latency, 0.01) if latency is not None else 0.0
+        await asyncio.sleep(probe_interval)
+
+
+@app.get("/worker-latency")
+def get_worker_latency():
+    return {"fastest_worker": fastest_worker, "latency_ms": worker_latency, "weight": worker_weight,
+            "outstanding": outstanding}
+
+
+def latency_percentile(samples, percent):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)] * 1000, 3)
+
+
+@app.get("/worker-stats")
+def get_worker_stats():
+    return {
+        "workers": {
+            worker_ip: {
+                "shard": worker_shard[worker_ip],
+                "state": worker_state[worker_ip],
+                "in_rotation": worker_ip in in_rotation,
+                "outstanding": outstanding[worker_ip],
+                "reads": worker_reads[worker_ip],
+                "errors": worker_read_errors[worker_ip],
+                "p50_ms": latency_percentile(worker_read_latency[worker_ip], 50),
+                "p99_ms": latency_percentile(worker_read_latency[worker_ip], 99),
+            }
+            for worker_ip in worker_ips
+        },
+    }
+
+
+# Replication state of each worker, refreshed in the background. Workers whose
+# replication is stopped or more than max_replica_lag seconds behind leave the
+# rotation; if every worker is out, reads fall back to all of them.
+max_replica_lag = setting("MAX_REPLICA_LAG", 5.0)
+lag_check_interval = setting("LAG_CHECK_INTERVAL", 1.0)
+ryw_timeout = setting("RYW_TIMEOUT", 2.0)
+replication = {
+    worker_ip: {"running": None, "seconds_behind": None, "gtid_executed": "", "gtid_set": {}}
+    for worker_ip in worker_ips
+}
+in_rotation = list(worker_ips)
+
+
+def parse_gtid_set(text):
+    gtid_set = {}
+    for part in "".join(text.split()).split(","):
+        if not part:
+            continue
+        source_uuid, *intervals = part.split(":")
+        ranges = gtid_set.setdefault(source_uuid.lower(), [])
+        for interval in intervals:
+            start, _, end = interval.partition("-")
+            ranges.append((int(start), int(end or start)))
+    return gtid_set
+
+
+def format_gtid_set(gtid_set):
+    return ",".join(
+        source_uuid + "".join(f":{start}-{end}" for start, end in ranges)
+        for source_uuid, ranges in gtid_set.items()
+    )
+
+
+def gtid_subset(required, executed):
+    for source_uuid, ranges in required.items():
+        applied = executed.get(source_uuid, [])
+        for start, end in ranges:
+            if not any(low <= start and end <= high for low, high in applied):
+                return False
+    return True
+
+
+async def check_replication(worker_ip):
+    state = replication[worker_ip]
+    try:
+        response = await upstream.client.get(f"http://{worker_ip}:8000/replication-status/", timeout=health_timeout)
+        status = response.json()
+        state["running"] = status["running"]
+        state["seconds_behind"] = status["seconds_behind"]
+        state["gtid_executed"] = status["gtid_executed"]
+        state["gtid_set"] = parse_gtid_set(status["gtid_executed"])
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        logger.warning(f"Replication check of {worker_ip} failed: {e!r}")
+        state["running"] = False
+
+
+async def read_manager_gtid_set(manager_ip):
+    try:
+        response = await upstream.client.get(f"http://{manager_ip}:8000/gtid-executed/", timeout=health_timeout)
+        return parse_gtid_set(response.json()["gtid_executed"])
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        logger.warning(f"Reading the GTID set of the manager {manager_ip} failed: {e!r}")
+        return None
+
+
+async def track_replication():
+    global in_rotation
+    while True:
+        # A joining worker becomes active once it has applied everything its manager had
+        # executed before its own replication state was read
+        joining = [worker_ip for worker_ip in worker_ips if worker_state[worker_ip] == "joining"]
+        joining_shards = sorted({worker_shard[worker_ip] for worker_ip in joining})
+        manager_gtid_sets = dict(zip(joining_shards, await asyncio.gather(
+            *(read_manager_gtid_set(shard_managers[shard]) for shard in joining_shards))))
+        checked = [worker_ip for worker_ip in worker_ips if worker_state[worker_ip] != "draining"]
+        await asyncio.gather(*(check_replication(worker_ip) for worker_ip in checked))
+        for worker_ip in joining:
+            manager_gtid_set = manager_gtid_sets.get(worker_shard.get(worker_ip))
+            if (manager_gtid_set is not None and worker_state.get(worker_ip) == "joining"
+                    and replication[worker_ip]["running"]
+                    and gtid_subset(manager_gtid_set, replication[worker_ip]["gtid_set"])):
+                worker_state[worker_ip] = "active"
+                logger.info(f"Worker {worker_ip} caught up with its manager, adding it to the rotation")
+        in_rotation = [
+            worker_ip for worker_ip in worker_ips
+            if worker_state[worker_ip] == "active"
+            and replication[worker_ip]["running"]
+            and replication[worker_ip]["seconds_behind"] is not None
+            and replication[worker_ip]["seconds_behind"] <= max_replica_lag
+        ]
+        await asyncio.sleep(lag_check_interval)
+
+
+@app.get("/replication")
+def get_replication():
+    return {
+        "in_rotation": in_rotation,
+        "max_replica_lag": max_replica_lag,
+        "workers": {
+            worker_ip: {key: value for key, value in state.items() if key != "gtid_set"}
+            for worker_ip, state in replication.items()
+        },
+    }
+
+
+# Read strategies: each one returns the candidate worker that serves the next read
+def pick_random(candidates):
+    return random.choice(candidates)
+
+
+def pick_direct(candidates):
+    return candidates[0]
+
+
+def pick_fastest(candidates):
+    if fastest_worker in candidates:
+        return fastest_worker
+    return min(candidates, key=lambda worker_ip: worker_latency[worker_ip] or float("inf"))
+
+
+def pick_least_outstanding(candidates):
+    return min(candidates, key=lambda worker_ip: (outstanding[worker_ip], random.random()))
+
+
+def pick_two_choices(candidates):
+    if len(candidates) < 2:
+        return candidates[0]
+    first, second = random.sample(candidates, 2)
+    return first if outstanding[first] <= outstanding[second] else second
+
+
+# Smooth weighted round-robin: spreads picks evenly instead of in bursts
+wrr_current = {worker_ip: 0.0 for worker_ip in worker_ips}
+
+
+def pick_weighted_round_robin(candidates):
+    total = 0.0
+    for worker_ip in candidates:
+        wrr_current[worker_ip] += worker_weight[worker_ip]
+        total += worker_weight[worker_ip]
+    if total == 0:
+        return pick_random(candidates)
+    chosen = max(candidates, key=wrr_current.get)
+    wrr_current[chosen] -= total
+    return chosen
+
+
+# Worker pool administration. Registering or removing a worker updates every
+# per-worker table above, so the probes, replication tracking and strategies
+# pick the change up without a restart.
+class WorkerRegistration(BaseModel):
+    worker_ip: str
+    shard: int = 0
+
+
+draining_tasks = set()
+
+
+def add_worker_state(worker_ip, shard):
+    worker_ips.append(worker_ip)
+    worker_shard[worker_ip] = shard
+    worker_state[worker_ip] = "joining"
+    outstanding[worker_ip] = 0
+    worker_reads[worker_ip] = 0
+    worker_read_errors[worker_ip] = 0
+    worker_read_latency[worker_ip] = deque(maxlen=latency_window)
+    worker_latency[worker_ip] = None
+    worker_weight[worker_ip] = 1.0
+    wrr_current[worker_ip] = 0.0
+    replication[worker_ip] = {"running": None, "seconds_behind": None, "gtid_executed": "", "gtid_set": {}}
+
+
+def remove_worker_state(worker_ip):
+    worker_ips.remove(worker_ip)
+    for table in (worker_shard, worker_state, outstanding, worker_reads, worker_read_errors, worker_read_latency,
+                  worker_latency, worker_weight, wrr_current, replication):
+        table.pop(worker_ip, None)
+
+
+async def drain_worker(worker_ip):
+    deadline = time.monotonic() + drain_timeout
+    while outstanding.get(worker_ip, 0) > 0 and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    # The worker may have registered again while draining
+    if worker_state.get(worker_ip) == "draining":
+        remove_worker_state(worker_ip)
+        logger.info(f"Worker {worker_ip} drained and removed")
+
+
+@app.get("/admin/workers")
+def list_workers():
+    return {
+        worker_ip: {
+            "shard": worker_shard[worker_ip],
+            "state": worker_state[worker_ip],
+            "in_rotation": worker_ip in in_rotation,
+            "outstanding": outstanding[worker_ip],
+            "seconds_behind": replication[worker_ip]["seconds_behind"],
+        }
+        for worker_ip in worker_ips
+    }
+
+
+@app.post("/admin/workers")
+async def register_worker(registration: WorkerRegistration):
+    global in_rotation
+    worker_ip, shard = registration.worker_ip, registration.shard
+    if not 0 <= shard < len(shard_managers):
+        raise HTTPException(status_code=400, detail=f"Unknown shard {shard}")
+    if worker_ip not in worker_state:
+        add_worker_state(worker_ip, shard)
+        logger.info(f"Worker {worker_ip} registered in shard {shard}, waiting for its replication to catch up")
+    elif worker_state[worker_ip] == "draining" or worker_shard[worker_ip] != shard:
+        # A worker moved to another shard has to catch up with its new manager first
+        worker_state[worker_ip] = "joining"
+        worker_shard[worker_ip] = shard
+        in_rotation = [rotated_ip for rotated_ip in in_rotation if rotated_ip != worker_ip]
+    return {"worker_ip": worker_ip, "shard": shard, "state": worker_state[worker_ip]}
+
+
+@app.delete("/admin/workers/{worker_ip}")
+async def deregister_worker(worker_ip: str):
+    global in_rotation
+    if worker_ip not in worker_state:
+        raise HTTPException(status_code=404, detail=f"Unknown worker {worker_ip}")
+    if worker_state[worker_ip] != "draining":
+        worker_state[worker_ip] = "draining"
+        in_rotation = [rotated_ip for rotated_ip in in_rotation if rotated_ip != worker_ip]
+        task = asyncio.create_task(drain_worker(worker_ip))
+        draining_tasks.add(task)
+        task.add_done_callback(draining_tasks.discard)
+    return {"worker_ip": worker_ip, "state": "draining"}
+
+
+# Shard map administration. The number of shards is fixed by the ids the managers have
+# allocated, but a new map can move a shard to another manager and add or drain workers.
+class Shard(BaseModel):
+    manager: str
+    workers: List[str] = []
+
+
+class ShardMap(BaseModel):
+    shards: List[Shard]
+
+
+def current_shard_map():
+    return {"shards": [
+        {"manager": manager_ip, "workers": [worker_ip for worker_ip in worker_ips if worker_shard[worker_ip] == index]}
+        for index, manager_ip in enumerate(shard_managers)
+    ]}
+
+
+async def apply_shard_map(new_map):
+    if len(new_map.shards) != len(shard_managers):
+        raise HTTPException(status_code=400, detail=f"The cluster has {len(shard_managers)} shards")
+    listed = {worker_ip: index for index, shard in enumerate(new_map.shards) for worker_ip in shard.workers}
+    for index, shard in enumerate(new_map.shards):
+        if shard.manager != shard_managers[index]:
+            logger.info(f"Shard {index} moves from manager {shard_managers[index]} to {shard.manager}")
+            shard_managers[index] = shard.manager
+    for worker_ip in list(worker_ips):
+        if worker_ip not in listed and worker_state[worker_ip] != "draining":
+            await deregister_worker(worker_ip)
+    for worker_ip, index in listed.items():
+        await register_worker(WorkerRegistration(worker_ip=worker_ip, shard=index))
+    return current_shard_map()
+
+
+@app.get("/admin/shard-map")
+def get_shard_map():
+    return current_shard_map()
+
+
+@app.put("/admin/shard-map")
+async def put_shard_map(new_map: ShardMap):
+    return await apply_shard_map(new_map)
+
+
+@app.post("/admin/shard-map/reload")
+async def reload_shard_map():
+    try:
+        with open(shard_map_file) as file:
+            new_map = ShardMap(**json.load(file))
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid shard map file: {e}")
+    return await apply_shard_map(new_map)
+
+
+READ_STRATEGIES = {
+    "random": pick_random,
+    "direct": pick_direct,
+    "ping": pick_fastest,
+    "lor": pick_least_outstanding,
+    "p2c": pick_two_choices,
+    "wrr": pick_weighted_round_robin,
+}
+
+
+def shard_candidates(shard):
+    # Workers of the shard in the rotation, or every active one of them if none is
+    candidates = [worker_ip for worker_ip in in_rotation if worker_shard.get(worker_ip) == shard]
+    return candidates or [
+        worker_ip for worker_ip in worker_ips if worker_shard[worker_ip] == shard and worker_state[worker_ip] == "active"
+    ]
+
+
+async def routed_read(strategy, item_id, gtid=None):
+    # Cached items are served without reaching a worker, except for read-your-writes
+    # reads which must observe the given GTID set
+    if cache_size and not gtid:
+        result = cache_get(item_id)
+        if result is not None:
+            return result
+
+    # With a GTID set (returned by /write), the read is pinned to the replicas known
+    # to have applied the part of it from the item's shard; if none has yet, the chosen
+    # replica waits for it
+    shard = item_shard(item_id)
+    candidates = shard_candidates(shard)
+    if not candidates:
+        raise HTTPException(status_code=503, detail=f"No worker available in shard {shard}")
+    wait_gtid = None
+    if gtid:
+        try:
+            required = parse_gtid_set(gtid)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid GTID set")
+        required = {
+            source_uuid: ranges for source_uuid, ranges in required.items()
+            if gtid_shard.get(source_uuid, shard) == shard
+        }
+        caught_up = [worker_ip for worker_ip in candidates if gtid_subset(required, replication[worker_ip]["gtid_set"])]
+        if caught_up:
+            candidates = caught_up
+        else:
+            wait_gtid = format_gtid_set(required)
+    worker_ip = READ_STRATEGIES[strategy](candidates)
+    started = time.monotonic()
+    result = await read_from_worker(worker_ip, item_id, wait_gtid)
+    if cache_size:
+        cache_put(item_id, result, started)
+    return result
+
+
+@app.get("/read/")
+async def read(item_id: int, strategy: str = "random", gtid: str = None):
+    if strategy not in READ_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy {strategy}")
+    return await routed_read(strategy, item_id, gtid)
+
+
+@app.get("/random-read/")
+async def random_read(item_id: int, gtid: str = None):
+    return await routed_read("random", item_id, gtid)
+
+
+@app.get("/direct-read/")
+async def direct_read(item_id: int, gtid: str = None):
+    return await routed_read("direct", item_id, gtid)
+
+
+@app.get("/ping-read/")
+async def ping_read(item_id: int, gtid: str = None):
+    return await routed_read("ping", item_id, gtid)
+
+
+@app.get("/lor-read/")
+async def lor_read(item_id: int, gtid: str = None):
+    return await routed_read("lor", item_id, gtid)
+
+
+@app.get("/p2c-read/")
+async def p2c_read(item_id: int, gtid: str = None):
+    return await routed_read("p2c", item_id, gtid)
+
+
+@app.get("/wrr-read/")
+async def wrr_read(item_id: int, gtid: str = None):
+    return await routed_read("wrr", item_id, gtid)
+
+
+# Reads by another key than item_id need every shard: one worker of each shard, picked
+# with the strategy, answers and the rows are merged. The Sakila actors are in every
+# shard, so rows are deduplicated by actor_id.
+@app.get("/search/")
+async def search(last_name: str, limit: int = 100, strategy: str = "random"):
+    if strategy not in READ_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy {strategy}")
+    picked = []
+    for shard in range(len(shard_managers)):
+        candidates = shard_candidates(shard)
+        if not candidates:
+            raise HTTPException(status_code=503, detail=f"No worker available in shard {shard}")
+        picked.append(READ_STRATEGIES[strategy](candidates))
+    results = await asyncio.gather(*(
+        request_worker(worker_ip, "/search_items/", {"last_name": last_name, "limit": limit})
+        for worker_ip in picked
+    ))
+    rows = {row["actor_id"]: row for result in results for row in result}
+    return [rows[actor_id] for actor_id in sorted(rows)[:limit]]
+
+
+# Reads of many item_ids in one request. The ids not in the cache are grouped by shard and
+# split in chunks of at most READ_MANY_CHUNK, at least one per worker of the shard. Each is
+# read with one IN query by a worker picked with the strategy among those without a chunk
+# yet, all chunks concurrently.
+read_many_chunk = setting("READ_MANY_CHUNK", 100)
+
+
+@app.post("/read_many")
+async def read_many(batch: ItemIds, strategy: str = "random"):
+    if strategy not in READ_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy {strategy}")
+    if not batch.item_ids:
+        raise HTTPException(status_code=400, detail="No item_ids")
+    item_ids = list(dict.fromkeys(batch.item_ids))
+    found = {}
+    shard_ids = {}
+    for item_id in item_ids:
+        result = cache_get(item_id) if cache_size else None
+        if result is None:
+            shard_ids.setdefault(item_shard(item_id), []).append(item_id)
+        else:
+            found[item_id] = result
+    chunks = []
+    for shard, ids in shard_ids.items():
+        candidates = shard_candidates(shard)
+        if not candidates:
+            raise HTTPException(status_code=503, detail=f"No worker available in shard {shard}")
+        chunk_size = min(read_many_chunk, -(-len(ids) // len(candidates)))
+        idle = []
+        for start in range(0, len(ids), chunk_size):
+            idle = idle or list(candidates)
+            worker_ip = READ_STRATEGIES[strategy](idle)
+            idle.remove(worker_ip)
+            chunks.append((worker_ip, ids[start:start + chunk_size]))
+    started = time.monotonic()
+    results = await asyncio.gather(*(
+        request_worker(worker_ip, "/get_items/", body={"item_ids": chunk}) for worker_ip, chunk in chunks
+    ))
+    for row in (row for result in results for row in result):
+        found[row["actor_id"]] = [row["first_name"], row["last_name"]]
+    if cache_size:
+        # Cached like the responses of /get_item/, so single reads hit them too
+        for _, chunk in chunks:
+            for item_id in chunk:
+                if item_id in found:
+                    cache_put(item_id, found[item_id], started)
+    return {
+        "items": [
+            {"actor_id": item_id, "first_name": found[item_id][0], "last_name": found[item_id][1]}
+            for item_id in item_ids if item_id in found
+        ],
+        "missing": [item_id for item_id in item_ids if item_id not in found],
+    }
+
+
+@app.get("/health")
+async def health():
+    # The manager of each shard and every active worker are checked concurrently
+    active = [worker_ip for worker_ip in worker_ips if worker_state[worker_ip] == "active"]
+    names = [f"manager_{manager_ip}" for manager_ip in shard_managers] + [f"worker_{worker_ip}" for worker_ip in active]
+    reports = await asyncio.gather(
+        *[upstream.check_upstream(f"http://{manager_ip}:8000/health") for manager_ip in shard_managers],
+        *[upstream.check_upstream(f"http://{worker_ip}:8000/health") for worker_ip in active],
+    )
+    return health_response({}, dict(zip(names, reports)))
@@ -0,0 +1,227 @@
+import json
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from services.config import setting
+
+# Trace context is propagated with the W3C traceparent header on every forwarded request.
+# Whether a trace is recorded is decided once, by the first node it reaches (the Gatekeeper),
+# and every other node follows the sampled flag of the header. The Gatekeeper ignores the
+# header of its clients, who could otherwise choose their trace IDs and have every request
+# traced (and logged, see services/logs.py) on every tier. Recorded spans are appended
+# to TRACE_FILE as JSON lines by a background thread and, if TRACE_COLLECTOR_URL is set,
+# posted there in batches.
+sample_rate = setting("TRACE_SAMPLE_RATE", 0.01)
+trace_file = setting("TRACE_FILE", "traces.jsonl")
+collector_url = setting("TRACE_COLLECTOR_URL", "")
+service_name = "service"  # Set by trace_requests()
+
+EXPORT_BATCH = 512  # Spans written at once at most
+EXPORT_INTERVAL = 1  # Seconds between two writes of the pending spans
+
+current_span = ContextVar("current_span", default=None)
+
+
+class SpanContext:
+    """
+    Identity of a span of another node, parsed from a traceparent header.
+    """
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "sampled", "start", "started", "attributes")
+
+    def __init__(self, name, kind, parent=None, **attributes):
+        self.name = name
+        self.kind = kind
+        if parent is None:
+            self.trace_id = f"{random.getrandbits(128):032x}"
+            self.parent_id = None
+            self.sampled = random.random() < sample_rate
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.sampled = parent.sampled
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.attributes = attributes
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def end(self, status="ok"):
+        if not self.sampled:
+            return
+        exporter.export({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": service_name,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "status": status,
+            "attributes": self.attributes,
+        })
+
+
+def parse_traceparent(header):
+    """
+    Args:
+        header: Value of a traceparent header, or None.
+    Returns:
+        SpanContext of the caller, or None if the header is missing or invalid.
+    """
+    if not header:
+        return None
+    parts = header.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return SpanContext(parts[1], parts[2], sampled)
+
+
+def new_span(name, kind="internal", parent=None, **attributes):
+    """
+    Start a span as child of parent, by default the current span of this request. Outside of
+    a request (background tasks, group commits) there is no parent and the span is not recorded.
+    Args:
+        name: Name of the span.
+        kind: "server", "client" or "internal".
+        parent: Span or SpanContext, a new trace is started if there is none.
+        attributes: Attributes recorded with the span.
+    Returns:
+        Span, recorded when its end() is called.
+    """
+    parent = parent or current_span.get()
+    span = Span(name, kind, parent, **attributes)
+    if parent is None:
+        span.sampled = False
+    return span
+
+
+@contextmanager
+def traced(name, kind="internal", **attributes):
+    # Span covering the block, current span inside it (also in the threadpool, which
+    # runs functions in a copy of the caller's context)
+    span = new_span(name, kind, **attributes)
+    token = current_span.set(span)
+    status = "ok"
+    try:
+        yield span
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        current_span.reset(token)
+        span.end(status)
+
+
+class SpanExporter:
+    """
+    Write recorded spans from a background thread so that requests never wait on I/O.
+    """
+    def __init__(self):
+        self.pending = queue.SimpleQueue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def export(self, record):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                    self.thread.start()
+        self.pending.put(record)
+
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            time.sleep(EXPORT_INTERVAL)
+            while len(batch) < EXPORT_BATCH:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            data = "".join(json.dumps(record) + "\n" for record in batch)
+            try:
+                with open(trace_file, "a") as file:
+                    file.write(data)
+                if collector_url:
+                    request = urllib.request.Request(collector_url, data=data.encode(), method="POST",
+                                                     headers={"Content-Type": "application/x-ndjson"})
+                    urllib.request.urlopen(request, timeout=5).close()
+            except OSError:
+                # Losing spans is better than slowing the service down
+                pass
+
+
+exporter = SpanExporter()
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening a server span for every HTTP request, child of the caller's
+    span when the request carries a traceparent header and trust_incoming is set.
+    """
+    def __init__(self, app, trust_incoming=True):
+        self.app = app
+        self.trust_incoming = trust_incoming
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = None
+        if self.trust_incoming:
+            for name, value in scope["headers"]:
+                if name == b"traceparent":
+                    header = value.decode("latin-1")
+                    break
+        span = Span(scope["path"], "server", parse_traceparent(header), method=scope["method"])
+        token = current_span.set(span)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_span.reset(token)
+            # The router sets the matched route in the scope
+            span.name = f"{scope['method']} {getattr(scope.get('route'), 'path', scope['path'])}"
+            span.attributes["status_code"] = status[0]
+            span.end("error" if status[0] >= 500 else "ok")
+
+
+def trace_requests(app, service, trust_incoming=True):
+    """
+    Add request tracing to a service.
+    Args:
+        app: FastAPI application of the service.
+        service: Name of the service in its spans.
+        trust_incoming: Follow the traceparent header of the requests. The edge of the
+            cluster turns it off: every request starts a trace sampled at TRACE_SAMPLE_RATE.
+    """
+    global service_name
+    service_name = service
+    app.add_middleware(TracingMiddleware, trust_incoming=trust_incoming)
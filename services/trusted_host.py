@@ -0,0 +1,69 @@
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+
+from services.config import setting
+from services.forwarding import ForwardingClient
+from services.health import health_response
+from services.logs import setup_service_logging
+from services.metrics import instrument
+from services.tracing import trace_requests
+
+# JSON records written by a background thread, request records sampled per route
+setup_service_logging()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await upstream.open()
+    yield
+    await upstream.close()
+
+
+app = FastAPI(lifespan=lifespan)
+instrument(app)
+trace_requests(app, "trusted_host")
+
+proxy_url = f"http://{setting('PROXY_IP', 'localhost')}:8000"
+
+# Connection pool used to forward requests to the proxy
+pool_size = setting("FORWARD_POOL_SIZE", 100)
+pool_timeout = setting("FORWARD_TIMEOUT", 10.0)
+health_timeout = setting("HEALTH_TIMEOUT", 4.0)
+upstream = ForwardingClient(pool_size, pool_timeout, health_timeout)
+
+# Endpoints of the proxy reachable through the trusted host. The gatekeeper has validated
+# the requests, so they are relayed to the proxy and its responses back without parsing.
+FORWARDED_ROUTES = {
+    "/write": "POST",
+    "/write_batch": "POST",
+    "/random-read/": "GET",
+    "/direct-read/": "GET",
+    "/ping-read/": "GET",
+    "/lor-read/": "GET",
+    "/p2c-read/": "GET",
+    "/wrr-read/": "GET",
+    "/read/": "GET",
+    "/search/": "GET",
+    "/read_many": "POST",
+}
+
+
+@app.get("/pool-stats")
+def get_pool_stats():
+    return upstream.report()
+
+
+async def relay(request: Request):
+    return await upstream.relay(request, f"{proxy_url}{request.url.path}")
+
+
+for path, method in FORWARDED_ROUTES.items():
+    app.add_api_route(path, relay, methods=[method])
+
+
+@app.get("/health")
+async def health():
+    return health_response({}, {"proxy": await upstream.check_upstream(f"{proxy_url}/health")})
@@ -0,0 +1,111 @@
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from services.db import open_pool, timed_query
+from services.health import health_response
+from services.metrics import instrument
+from services.models import ItemIds
+from services.tracing import trace_requests
+
+app = FastAPI()
+instrument(app)
+trace_requests(app, "worker")
+
+db_pool = open_pool()
+
+
+def fetch_row(item_id, wait_gtid=None, wait_timeout=0):
+    with db_pool.connection() as conn, timed_query("fetch_row"):
+        if wait_gtid:
+            # Read-your-writes: block until this replica has applied the write
+            cursor = conn.cursor()
+            cursor.execute("SELECT WAIT_FOR_EXECUTED_GTID_SET(%s, %s)", (wait_gtid, wait_timeout))
+            waited = cursor.fetchone()[0]
+            cursor.close()
+            if waited != 0:
+                raise TimeoutError("Replica has not applied the requested GTID set yet")
+            # The pooled connections are in autocommit mode (see open_pool), so the SELECT
+            # below takes a new snapshot, which holds the write just applied
+        query = "SELECT first_name, last_name FROM actor WHERE actor_id = %s"
+        rows = db_pool.execute_prepared(conn, query, (item_id,)).fetchall()
+    return rows[0] if rows else None
+
+
+def fetch_rows(item_ids):
+    # The id list is padded to a power of two with its last id, so a few prepared
+    # statements serve every list length
+    size = 1 << (len(item_ids) - 1).bit_length()
+    params = item_ids + item_ids[-1:] * (size - len(item_ids))
+    with db_pool.connection() as conn, timed_query("fetch_rows"):
+        query = "SELECT actor_id, first_name, last_name FROM actor WHERE actor_id IN (" + ", ".join(["%s"] * size) + ")"
+        rows = db_pool.execute_prepared(conn, query, params, dictionary=True).fetchall()
+    return rows
+
+
+def search_rows(last_name, limit):
+    with db_pool.connection() as conn, timed_query("search_rows"):
+        query = "SELECT actor_id, first_name, last_name FROM actor WHERE last_name = %s ORDER BY actor_id LIMIT %s"
+        rows = db_pool.execute_prepared(conn, query, (last_name, limit), dictionary=True).fetchall()
+    return rows
+
+
+def read_replication_status():
+    with db_pool.connection() as conn, timed_query("read_replication_status"):
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        cursor.execute("SHOW REPLICA STATUS")
+        status = cursor.fetchone()
+        cursor.execute("SELECT @@GLOBAL.gtid_executed AS gtid_executed")
+        gtid_executed = cursor.fetchone()["gtid_executed"]
+        cursor.close()
+    running = bool(status) and status["Replica_IO_Running"] == "Yes" and status["Replica_SQL_Running"] == "Yes"
+    return {
+        "running": running,
+        "seconds_behind": status["Seconds_Behind_Source"] if status else None,
+        "gtid_executed": "".join(gtid_executed.split()),
+    }
+
+
+@app.get("/pool-stats")
+def get_pool_stats():
+    return db_pool.report()
+
+
+@app.get("/health")
+async def health():
+    try:
+        status = await run_in_threadpool(read_replication_status)
+        checks = {"database": True, "replication": status["running"]}
+    except Exception:
+        checks = {"database": False, "replication": False}
+    return health_response(checks)
+
+
+@app.get("/replication-status/")
+async def replication_status():
+    return await run_in_threadpool(read_replication_status)
+
+
+@app.get("/get_item/")
+async def get_item(item_id: int, wait_gtid: str = None, wait_timeout: float = 2):
+    try:
+        result = await run_in_threadpool(fetch_row, item_id, wait_gtid, wait_timeout)
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if result:
+        return result
+    else:
+        return {"status": 200, "message": "Error"}
+
+
+@app.post("/get_items/")
+async def get_items(batch: ItemIds):
+    # Found rows only, the caller knows which ids it asked for. A POST body, as hundreds
+    # of ids would make a long query string
+    if not batch.item_ids:
+        raise HTTPException(status_code=400, detail="No item_ids")
+    return await run_in_threadpool(fetch_rows, batch.item_ids)
+
+
+@app.get("/search_items/")
+async def search_items(last_name: str, limit: int = 100):
+    return await run_in_threadpool(search_rows, last_name, limit)
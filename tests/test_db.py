@@ -0,0 +1,49 @@
+import pytest
+
+mysql_connector = pytest.importorskip("mysql.connector")
+
+from services.db import open_pool  # noqa: E402
+
+# Runs against the MySQL server of the DB_* settings (a local sakila by default), and
+# is skipped when there is none
+TABLE = "pool_snapshot_test"
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # A single pooled connection, so every read goes through the same one
+    monkeypatch.setenv("DB_POOL_SIZE", "1")
+    monkeypatch.setenv("DB_POOL_MAX_OVERFLOW", "0")
+    pool = open_pool()
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (id INT PRIMARY KEY)")
+            cursor.execute(f"DELETE FROM {TABLE}")
+            cursor.close()
+    except (mysql_connector.Error, ImportError) as e:
+        # ImportError: the connector is installed without its C extension
+        pytest.skip(f"No MySQL server available: {e}")
+    yield pool
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP TABLE {TABLE}")
+        cursor.close()
+
+
+def read_ids(pool):
+    with pool.connection() as conn:
+        return [row[0] for row in pool.execute_prepared(conn, f"SELECT id FROM {TABLE} ORDER BY id").fetchall()]
+
+
+def test_pooled_connection_sees_later_writes(pool):
+    assert read_ids(pool) == []
+    # Written by another connection, as the replication thread does on a worker
+    other = mysql_connector.connect(**pool.connect_args)
+    cursor = other.cursor()
+    cursor.execute(f"INSERT INTO {TABLE} (id) VALUES (1)")
+    other.commit()
+    cursor.close()
+    other.close()
+    assert pool.stats["created"] == 1
+    assert read_ids(pool) == [1]